@@ -217,4 +217,1150 @@ new tree predict on the errors of the last, so the final prediction is like a
 big long Taylor approximation of `y`. I've gone over XGB before in detail, in 
 practice this concept is mathed out to optimize a fairly counter-intuitive 
 objective function, but it's all in service of updating on the errors. 
-"""
\ No newline at end of file
+"""
+#%% [markdown]
+"""
+### Building One
+
+Let me actually write the greedy algorithm down, because the `O(n*f*d)` only 
+works out if the split search is done carefully. The naive version, for every
+feature and every candidate threshold `t`, counts up the classes on each side.
+That's `O(n)` per threshold and `O(n**2)` per feature. 
+
+The fix is to sort. If the node's points are in sorted order along feature `j`,
+then moving `t` past one more point just moves that one point from the right 
+child to the left child. So a cumulative sum of the class counts (one-hot 
+labels) down the sorted order gives the left child's counts at _every_ 
+threshold at once, and the right child is the total minus the left. Plug all
+of those into the loss in one vectorized shot and take the argmin. Only
+thresholds between two different values of `x[j]` are real splits, and the 
+threshold is the midpoint. 
+
+And we only sort once. Each feature is sorted at the root, and when a node 
+splits, walking each feature's sorted index list and sending every index to
+its side keeps both children's lists sorted too. That's `O(n)` per feature
+per node, so `O(n*f)` per level of the tree, which is where `O(n*f*d)` comes from. 
+
+For regression it's the same trick with cumulative sums of `y` and `y**2`,
+since the squared error of a region is `Sigma[i]*y[i]**2 - (Sigma[i]*y[i])**2/n`. 
+
+All five of the regularization options from above are in here. The tree is
+grown best-first (always split the leaf with the biggest loss decrease next),
+which only matters if there's a cap on the number of nodes, and pruning on a
+validation set happens after the fact. 
+"""
+
+#%% [python]
+import heapq
+import itertools
+import numpy as np
+
+def class_loss(counts, criterion):
+    # total (not average) loss of a region with these class counts, along the last axis
+    n = counts.sum(-1)
+    if criterion == "gini":
+        return n - (counts**2).sum(-1) / np.maximum(n, 1e-12)
+    if criterion == "entropy":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return -np.nansum(counts * np.log2(counts / n[..., None]), -1)
+    if criterion == "misclassification":
+        return n - counts.max(-1)
+    raise ValueError(f"unknown criterion {criterion!r}")
+
+
+class Node:
+    def __init__(self, value, n, loss, depth):
+        self.value = value
+        self.n = n
+        self.loss = loss
+        self.depth = depth
+        self.feature = None
+        self.threshold = None
+        self.categories = None
+        self.left = None
+        self.right = None
+
+    @property
+    def is_leaf(self):
+        return self.left is None
+
+    def goes_left(self, x):
+        if self.categories is not None:
+            return np.isin(x, self.categories)
+        return x < self.threshold
+
+
+class DecisionTree:
+    def __init__(self, criterion="gini", max_depth=None, min_samples_leaf=1, max_nodes=None,
+                 min_loss_decrease=0.0, max_features=None, rng=None, categorical=None):
+        self.criterion = criterion
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.max_nodes = max_nodes
+        self.min_loss_decrease = min_loss_decrease
+        self.max_features = max_features
+        self.rng = rng
+        self.categorical = categorical
+
+    @property
+    def regression(self):
+        return self.criterion == "squared"
+
+    def _targets(self, y):
+        if self.regression:
+            y = np.asarray(y, dtype=float)
+            return np.c_[np.ones_like(y), y, y**2]
+        self.classes, y = np.unique(y, return_inverse=True)
+        return np.eye(len(self.classes))[y]
+
+    def _loss(self, stats):
+        if self.regression:
+            return stats[..., 2] - stats[..., 1]**2 / np.maximum(stats[..., 0], 1e-12)
+        return class_loss(stats, self.criterion)
+
+    def _count(self, stats):
+        return stats[..., 0] if self.regression else stats.sum(-1)
+
+    def _make_node(self, stats, depth):
+        n = self._count(stats)
+        value = stats[1] / n if self.regression else stats
+        return Node(value, n, self._loss(stats), depth)
+
+    def _category_orders(self, stats):
+        # the sort keys to try; one is exact for regression and binary classification
+        if self.regression:
+            return [stats[:, 1] / stats[:, 0]]
+        p = stats / stats.sum(1, keepdims=True)
+        if stats.shape[1] == 2:
+            return [p[:, 1]]
+        return [p[:, c] for c in range(stats.shape[1])]
+
+    def _best_category_split(self, stats):
+        # stats has one row per category code; returns (child loss, left codes, left stats, right stats)
+        msl = self.min_samples_leaf
+        present = np.flatnonzero(self._count(stats) > 0)
+        if len(present) < 2:
+            return None
+        total = stats[present].sum(0)
+        best = None
+        for key in self._category_orders(stats[present]):
+            order = present[np.argsort(key, kind="stable")]
+            left = np.cumsum(stats[order], axis=0)[:-1]
+            right = total - left
+            valid = (self._count(left) >= msl) & (self._count(right) >= msl)
+            if not valid.any():
+                continue
+            child_loss = np.where(valid, self._loss(left) + self._loss(right), np.inf)
+            i = child_loss.argmin()
+            if best is None or child_loss[i] < best[0]:
+                best = (child_loss[i], np.sort(order[:i + 1]), left[i], right[i])
+        return best
+
+    def _n_candidates(self):
+        f, m = self.n_features, self.max_features
+        if m is None:
+            return f
+        if m == "sqrt":
+            return max(1, int(np.sqrt(f)))
+        if isinstance(m, float):
+            return max(1, int(m * f))
+        return min(m, f)
+
+    def _candidate_features(self):
+        # a fresh random subset of features at every node, for random forests
+        if self._n_features_per_node == self.n_features:
+            return range(self.n_features)
+        return np.sort(self._rng.choice(self.n_features, self._n_features_per_node, replace=False))
+
+    def _splittable(self, node, n):
+        if self.max_depth is not None and node.depth >= self.max_depth:
+            return False
+        return n >= 2 * self.min_samples_leaf
+
+    def _accept(self, node, best):
+        # best is (child loss, feature, threshold, left stats, right stats, extra)
+        if best is None:
+            return None
+        gain = node.loss - best[0]
+        if gain <= 0 or gain < self.min_loss_decrease * self.n_train:
+            return None
+        return (gain,) + best[1:]
+
+    def _root_state(self, X, T, rows, orders):
+        index_type = np.int32 if len(X) < 2**31 else np.int64
+        self._goes_left = np.zeros(len(X), dtype=bool)
+        self._codes = {j: X[:, j].astype(np.intp) for j in self.categorical or ()}
+        if orders is None:
+            orders = [np.argsort(X[:, j], kind="stable").astype(index_type) for j in range(X.shape[1])]
+        if rows is not None:
+            # rows with zero weight contribute nothing, so they never enter the sorted lists
+            keep = np.zeros(len(X), dtype=bool)
+            keep[rows] = True
+            orders = [s[keep[s]] for s in orders]
+        return orders
+
+    def _best_split(self, X, T, node, orders):
+        n = len(orders[0])
+        if not self._splittable(node, n):
+            return None
+        msl = self.min_samples_leaf
+        best = None
+        for j in self._candidate_features():
+            s = orders[j]
+            if j in self._codes:
+                codes = self._codes[j][s]
+                stats = np.stack([np.bincount(codes, weights=T[s, c]) for c in range(T.shape[1])], 1)
+                found = self._best_category_split(stats)
+                if found is not None and (best is None or found[0] < best[0]):
+                    loss, categories, left, right = found
+                    best = (loss, j, categories, left, right, s[np.isin(codes, categories)])
+                continue
+            x = X[s, j]
+            left = np.cumsum(T[s], axis=0)[:-1]
+            right = left[-1] + T[s[-1]] - left
+            # position i means the first i+1 sorted points go left
+            valid = x[1:] > x[:-1]
+            valid[:msl - 1] = False
+            valid[n - msl:] = False
+            if not valid.any():
+                continue
+            child_loss = np.where(valid, self._loss(left) + self._loss(right), np.inf)
+            i = child_loss.argmin()
+            if best is None or child_loss[i] < best[0]:
+                best = (child_loss[i], j, (x[i] + x[i + 1]) / 2, left[i], right[i], s[:i + 1])
+        return self._accept(node, best)
+
+    def _partition(self, X, T, orders, split):
+        left_idx = split[-1]
+        goes_left = self._goes_left
+        goes_left[left_idx] = True
+        left_orders, right_orders = [], []
+        for s in orders:
+            side = goes_left[s]
+            left_orders.append(s[side])
+            right_orders.append(s[~side])
+        goes_left[left_idx] = False
+        return left_orders, right_orders
+
+    def fit(self, X, y, sample_weight=None, orders=None):
+        X = np.asarray(X, dtype=float)
+        T = self._targets(y)
+        rows = None
+        if sample_weight is not None:
+            T *= sample_weight[:, None]
+            rows = np.flatnonzero(sample_weight > 0)
+        self.n_train, self.n_features = X.shape
+        self._rng = np.random.default_rng(self.rng)
+        self._n_features_per_node = self._n_candidates()
+        state = self._root_state(X, T, rows, orders)
+        self._grow(X, T, state, T.sum(0))
+        # fit-time scratch, so fitted trees (and the forests and bags shipping them back from workers) stay small
+        self._goes_left = self._codes = None
+        return self
+
+    def _finish_leaf(self, node, state):
+        pass
+
+    def _grow(self, X, T, state, root_stats):
+        self.root = self._make_node(root_stats, 0)
+        self.n_nodes = 1
+        tie = itertools.count()
+        heap = []
+
+        def push(node, state):
+            split = self._best_split(X, T, node, state)
+            if split is None:
+                self._finish_leaf(node, state)
+            else:
+                heapq.heappush(heap, (-split[0], next(tie), node, split, state))
+
+        push(self.root, state)
+        while heap:
+            if self.max_nodes is not None and self.n_nodes + 2 > self.max_nodes:
+                break
+            _, _, node, split, state = heapq.heappop(heap)
+            left_state, right_state = self._partition(X, T, state, split)
+            _, node.feature, split_point, left_stats, right_stats = split[:5]
+            if isinstance(split_point, np.ndarray):
+                node.categories = split_point
+            else:
+                node.threshold = split_point
+            node.left = self._make_node(left_stats, node.depth + 1)
+            node.right = self._make_node(right_stats, node.depth + 1)
+            self.n_nodes += 2
+            push(node.left, left_state)
+            push(node.right, right_state)
+        for _, _, node, _, state in heap:
+            self._finish_leaf(node, state)
+        return self
+
+    def _route(self, node, X, idx, out):
+        if node.is_leaf:
+            out[idx] = node.value
+            return
+        left = node.goes_left(X[idx, node.feature])
+        self._route(node.left, X, idx[left], out)
+        self._route(node.right, X, idx[~left], out)
+
+    def _leaf_values(self, X):
+        X = np.asarray(X, dtype=float)
+        out = np.empty(len(X) if self.regression else (len(X), len(self.classes)))
+        self._route(self.root, X, np.arange(len(X)), out)
+        return out
+
+    def predict_proba(self, X):
+        counts = self._leaf_values(X)
+        return counts / counts.sum(1, keepdims=True)
+
+    def predict(self, X):
+        if self.regression:
+            return self._leaf_values(X)
+        return self.classes[self._leaf_values(X).argmax(1)]
+
+    def _node_error(self, node, y):
+        if self.regression:
+            return ((y - node.value)**2).sum()
+        return (y != node.value.argmax()).sum()
+
+    def _train_error(self, node):
+        # resubstitution error: squared error, or misclassified (weighted) count
+        return node.loss if self.regression else node.n - node.value.max()
+
+    def pruning_path(self, X_val, y_val):
+        # rows of (alpha, leaves, train error, validation error) for the whole weakest-link sequence
+        X_val = np.asarray(X_val, dtype=float)
+        y_val = np.asarray(y_val if self.regression else np.searchsorted(self.classes, y_val))
+        self._collapse_alpha = {}
+
+        def sweep(node, idx):
+            as_leaf = [1, self._train_error(node), self._node_error(node, y_val[idx])]
+            if node.is_leaf:
+                return np.array([[0.0] + as_leaf])
+            left = node.goes_left(X_val[idx, node.feature])
+            a, b = sweep(node.left, idx[left]), sweep(node.right, idx[~left])
+            # cost of the best subtree is piecewise linear in alpha; add the children's pieces
+            starts = np.union1d(a[:, 0], b[:, 0])
+            path = np.c_[starts, a[np.searchsorted(a[:, 0], starts, "right") - 1, 1:]
+                         + b[np.searchsorted(b[:, 0], starts, "right") - 1, 1:]]
+            # collapse once R(t) + alpha <= R(subtree) + alpha * leaves(subtree)
+            alpha = np.maximum(path[:, 0], (as_leaf[1] - path[:, 2]) / (path[:, 1] - 1))
+            k = np.argmax(alpha < np.append(path[1:, 0], np.inf))
+            self._collapse_alpha[id(node)] = alpha[k]
+            return np.r_[path[:k + (alpha[k] > path[k, 0])], [[alpha[k]] + as_leaf]]
+
+        return sweep(self.root, np.arange(len(X_val)))
+
+    def prune(self, X_val, y_val, method="reduced_error"):
+        if method == "cost_complexity":
+            # option 5, CART style: the subtree in the pruning sequence with the lowest validation error
+            path = self.pruning_path(X_val, y_val)
+            best = len(path) - 1 - np.argmin(path[::-1, 3])
+            self.ccp_alpha = path[best, 0]
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                if node.is_leaf:
+                    continue
+                if self._collapse_alpha[id(node)] <= self.ccp_alpha:
+                    node.left = node.right = node.feature = node.threshold = node.categories = None
+                else:
+                    stack.extend((node.left, node.right))
+            self._collapse_alpha = None
+            self.n_nodes = sum(1 for _ in self.nodes())
+            return self
+
+        # option 5: collapse any split that doesn't reduce validation error
+        X_val = np.asarray(X_val, dtype=float)
+        y_val = np.asarray(y_val if self.regression else np.searchsorted(self.classes, y_val))
+
+        def error(node, idx):
+            leaf_error = self._node_error(node, y_val[idx])
+            if node.is_leaf:
+                return leaf_error
+            left = node.goes_left(X_val[idx, node.feature])
+            subtree_error = error(node.left, idx[left]) + error(node.right, idx[~left])
+            if leaf_error <= subtree_error:
+                node.left = node.right = node.feature = node.threshold = node.categories = None
+                return leaf_error
+            return subtree_error
+
+        error(self.root, np.arange(len(X_val)))
+        self.n_nodes = sum(1 for _ in self.nodes())
+        return self
+
+    def nodes(self):
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            if not node.is_leaf:
+                stack.extend((node.right, node.left))
+
+#%% [python]
+rng = np.random.default_rng(0)
+X = rng.normal(size=(20_000, 5))
+y = ((X[:, 0] > 0.3) ^ (X[:, 1] < -0.5)).astype(int)
+y = np.where(rng.random(20_000) < 0.1, 1 - y, y)
+tree = DecisionTree(criterion="entropy", max_depth=8, min_samples_leaf=20).fit(X[:10_000], y[:10_000])
+print(tree.n_nodes, (tree.predict(X[15_000:]) == y[15_000:]).mean())
+tree.prune(X[10_000:15_000], y[10_000:15_000])
+print(tree.n_nodes, (tree.predict(X[15_000:]) == y[15_000:]).mean())
+
+#%% [markdown]
+"""
+### Histogram Splits
+
+LightGBM and XGBoost's `hist` mode push this further. Instead of considering
+every distinct value of a feature as a threshold, bucket each feature into at
+most 256 bins up front (at its quantiles), and only split between bins. Two
+nice things happen: 
+
+1. The whole feature matrix becomes a `uint8` matrix of bin numbers. That's 
+   8x smaller than float64, and we never need to sort anything. 
+2. A node's split search is just a histogram, the class counts per bin for 
+   each feature, and cumulative sums over 256 bins instead of `n` sorted 
+   points. So it's `O(bins)` per feature per node, after the `O(n)` pass to
+   build the histogram. 
+
+And then the histogram subtraction trick. The parent's histogram is the sum of
+its two children's, so we only ever build the histogram of the _smaller_ child
+directly, and get the bigger one as parent minus sibling. The per-node work 
+that does depend on `n` roughly halves again. 
+
+The thresholds are stored back in the original units of the feature (the bin
+edge), so prediction doesn't change at all. 
+"""
+
+#%% [python]
+def bin_features(X, max_bins=256, categorical=()):
+    if max_bins > 256:
+        raise ValueError(f"max_bins={max_bins}, but bin codes are stored as uint8, so at most 256")
+    X = np.asarray(X, dtype=float)
+    edges = []
+    bins = np.empty(X.shape, dtype=np.uint8)
+    for j in range(X.shape[1]):
+        if j in categorical:
+            if X[:, j].min() < 0:
+                raise ValueError(f"categorical feature {j} needs non-negative integer codes")
+            # each level gets its own bin, except that past max_bins - 1 levels the rarest ones share
+            # the last bin with any level not seen here
+            levels, counts = np.unique(X[:, j].astype(np.intp), return_counts=True)
+            if len(levels) > max_bins - 1:
+                levels = np.sort(levels[np.argsort(-counts, kind="stable")[:max_bins - 1]])
+            edges.append(levels)
+            bins[:, j] = _category_bins(X[:, j], levels)
+            continue
+        values = np.unique(X[:, j])
+        if len(values) <= max_bins:
+            cuts = (values[1:] + values[:-1]) / 2
+        else:
+            cuts = np.unique(np.quantile(X[:, j], np.linspace(0, 1, max_bins + 1)[1:-1]))
+        edges.append(cuts)
+        bins[:, j] = np.searchsorted(cuts, X[:, j], side="right")
+    return bins, edges
+
+
+def _category_bins(x, levels):
+    pos = np.minimum(np.searchsorted(levels, x), len(levels) - 1)
+    return np.where(levels[pos] == x, pos, len(levels))
+
+
+def apply_bins(X, edges, categorical=()):
+    X = np.asarray(X, dtype=float)
+    return np.stack([_category_bins(X[:, j], e) if j in categorical else np.searchsorted(e, X[:, j], side="right")
+                     for j, e in enumerate(edges)], 1).astype(np.uint8)
+
+
+class HistDecisionTree(DecisionTree):
+    def __init__(self, criterion="gini", max_depth=None, min_samples_leaf=1, max_nodes=None,
+                 min_loss_decrease=0.0, max_features=None, rng=None, categorical=None, max_bins=256):
+        super().__init__(criterion, max_depth, min_samples_leaf, max_nodes, min_loss_decrease,
+                         max_features, rng, categorical)
+        self.max_bins = max_bins
+
+    def _histogram(self, T, idx):
+        # stats per (feature, bin), one bincount per feature and target column so temporaries stay O(n)
+        weights = np.ascontiguousarray(T[idx].T)
+        hist = np.empty((self.n_features, self.max_bins, T.shape[1]))
+        for j in range(self.n_features):
+            codes = self._bins[idx, j]
+            for c in range(T.shape[1]):
+                hist[j, :, c] = np.bincount(codes, weights=weights[c], minlength=self.max_bins)
+        return hist
+
+    def _root_state(self, X, T, rows, orders):
+        self._bins, self.bin_edges = bin_features(X, self.max_bins, self.categorical or ())
+        idx = np.arange(len(X)) if rows is None else rows
+        return idx, self._histogram(T, idx)
+
+    def _best_split(self, X, T, node, state):
+        idx, hist = state
+        if not self._splittable(node, len(idx)):
+            return None
+        msl = self.min_samples_leaf
+        left = np.cumsum(hist, axis=1)[:, :-1]
+        right = left[:, -1:] + hist[:, -1:] - left
+        valid = (self._count(left) >= msl) & (self._count(right) >= msl)
+        candidates = self._candidate_features()
+        skip = np.ones(self.n_features, dtype=bool)
+        skip[candidates] = False
+        skip[list(self.categorical or ())] = True
+        valid[skip] = False
+        best = None
+        if valid.any():
+            child_loss = np.where(valid, self._loss(left) + self._loss(right), np.inf)
+            j, b = np.unravel_index(child_loss.argmin(), child_loss.shape)
+            best = (child_loss[j, b], int(j), self.bin_edges[j][b], left[j, b], right[j, b], b)
+        for j in self.categorical or ():
+            if j in candidates:
+                found = self._best_category_split(hist[j])
+                if found is not None and (best is None or found[0] < best[0]):
+                    best = (found[0], j) + self._category_split(j, hist[j], *found[1:])
+        return self._accept(node, best)
+
+    def _category_split(self, j, hist, left_bins, left_stats, right_stats):
+        # (left codes, left stats, right stats, left bins); a Node sends every code it doesn't list
+        # right, so the shared last bin has to be on the right, and the sides get flipped if it isn't
+        levels = self.bin_edges[j]
+        if left_bins[-1] == len(levels):
+            present = np.flatnonzero(self._count(hist) > 0)
+            left_bins = present[~np.isin(present, left_bins)]
+            left_stats, right_stats = right_stats, left_stats
+        return levels[left_bins], left_stats, right_stats, left_bins
+
+    def _partition(self, X, T, state, split):
+        idx, hist = state
+        j, b = split[1], split[-1]
+        if isinstance(b, np.ndarray):
+            side = np.isin(self._bins[idx, j], b)
+        else:
+            side = self._bins[idx, j] <= b
+        left_idx, right_idx = idx[side], idx[~side]
+        if len(left_idx) <= len(right_idx):
+            left_hist = self._histogram(T, left_idx)
+            right_hist = hist - left_hist
+        else:
+            right_hist = self._histogram(T, right_idx)
+            left_hist = hist - right_hist
+        return (left_idx, left_hist), (right_idx, right_hist)
+
+    def fit(self, X, y, sample_weight=None):
+        super().fit(X, y, sample_weight)
+        del self._bins
+        return self
+
+#%% [python]
+hist_tree = HistDecisionTree(criterion="entropy", max_depth=8, min_samples_leaf=20).fit(X[:10_000], y[:10_000])
+print(hist_tree.n_nodes, (hist_tree.predict(X[15_000:]) == y[15_000:]).mean())
+
+#%% [markdown]
+"""
+### Random Forests in Code
+
+Putting the Random Forest description into practice, and making it fast
+enough to actually use. A few things fall out of the tree builder above: 
+
+- A bootstrap sample is just how many times each row got drawn. So rather than
+  copying the data for each tree, pass those counts in as weights. Rows that
+  weren't drawn get weight 0 and drop out of the tree entirely. 
+- The feature sampling happens at every node, not once per tree. That's the
+  `max_features` option on the tree, and `sqrt(f)` is the usual choice for 
+  classification. 
+- The trees are independent, so grow them in parallel. Every worker reads the
+  same copy of `X` out of shared memory, and we even do the presort once up 
+  front and share that too, since the bootstrap only changes the weights. 
+"""
+
+#%% [python]
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+@contextlib.contextmanager
+def shared_arrays(**arrays):
+    blocks, specs = [], {}
+    try:
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a)
+            shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+            specs[name] = (shm.name, a.shape, a.dtype.str)
+        yield specs
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+_shared = {}
+
+def _attach_shared(specs):
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = SharedMemory(name=shm_name)
+        _shared[name] = (shm, np.ndarray(shape, dtype, buffer=shm.buf))
+
+
+def _grow_forest_tree(tree, seed):
+    X, y, orders = (_shared[k][1] for k in ("X", "y", "orders"))
+    rng = np.random.default_rng(seed)
+    weights = np.bincount(rng.integers(0, len(X), len(X)), minlength=len(X)).astype(float)
+    tree.rng = rng
+    return tree.fit(X, y, sample_weight=weights, orders=list(orders))
+
+
+class RandomForest:
+    def __init__(self, n_trees=100, criterion="gini", max_features="sqrt", max_depth=None,
+                 min_samples_leaf=1, n_jobs=None, rng=None, categorical=None):
+        self.n_trees = n_trees
+        self.criterion = criterion
+        self.max_features = max_features
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.n_jobs = n_jobs
+        self.rng = rng
+        self.categorical = categorical
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        orders = np.argsort(X, axis=0, kind="stable").T.astype(np.int32 if len(X) < 2**31 else np.int64)
+        template = DecisionTree(self.criterion, self.max_depth, self.min_samples_leaf,
+                                max_features=self.max_features, categorical=self.categorical)
+        seeds = np.random.SeedSequence(self.rng).spawn(self.n_trees)
+        with shared_arrays(X=X, y=np.asarray(y), orders=orders) as specs:
+            with ProcessPoolExecutor(self.n_jobs, initializer=_attach_shared, initargs=(specs,)) as pool:
+                self.trees = list(pool.map(_grow_forest_tree, [template] * self.n_trees, seeds))
+        return self
+
+    def predict_proba(self, X):
+        return sum(tree.predict_proba(X) for tree in self.trees) / len(self.trees)
+
+    def predict(self, X):
+        if self.criterion == "squared":
+            return sum(tree.predict(X) for tree in self.trees) / len(self.trees)
+        return self.trees[0].classes[self.predict_proba(X).argmax(1)]
+
+#%% [python]
+forest = RandomForest(n_trees=50, min_samples_leaf=5, rng=0).fit(X[:10_000], y[:10_000])
+print((forest.predict(X[15_000:]) == y[15_000:]).mean())
+
+#%% [markdown]
+"""
+### Bagging Anything
+
+The forest above is one specific bagged model, but `G(m)` works for any model.
+So here's the general version: give it a model with a `fit` and a `predict`, 
+and it fits `M` copies on bootstrap samples in parallel and averages them. Same
+tricks as the forest, if the model's `fit` takes a `sample_weight`, the 
+bootstrap is just weights, otherwise each worker indexes out its own sample. 
+
+The free lunch here is out-of-bag (OOB) error. Each bootstrap sample misses 
+about `(1 - 1/n)**n ~= 1/e ~= 37%` of the rows. So every row has a bunch of 
+models that never saw it, and averaging just those models' predictions for 
+that row is an honest out-of-sample prediction. That gives a validation error
+with no held-out set. 
+
+And we can check the variance story from earlier directly. If `X[i]` is the 
+error of model `i`, with variance `sigma**2` and average pairwise correlation 
+`rho`, the error of the average of `M` of them has variance 
+`rho*sigma**2 + (1-rho)*sigma**2/M`. Estimate `sigma**2` and `rho` from the 
+models' errors on some data and we know how close we are to the `rho*sigma**2`
+floor, which tells us when adding more models stops being worth it. 
+"""
+
+#%% [python]
+import copy
+import inspect
+
+def _fit_bagged(model, seed, n_rows):
+    X, y = _shared["X"][1], _shared["y"][1]
+    rng = np.random.default_rng(seed)
+    counts = np.bincount(rng.integers(0, n_rows, n_rows), minlength=n_rows)
+    model = copy.deepcopy(model)
+    if "sample_weight" in inspect.signature(model.fit).parameters:
+        model.fit(X, y, sample_weight=counts.astype(float))
+    else:
+        idx = np.repeat(np.arange(n_rows), counts)
+        model.fit(X[idx], y[idx])
+    return model, np.flatnonzero(counts == 0)
+
+
+class Bagging:
+    def __init__(self, model, n_models=50, regression=False, n_jobs=None, rng=None):
+        self.model = model
+        self.n_models = n_models
+        self.regression = regression
+        self.n_jobs = n_jobs
+        self.rng = rng
+
+    def fit(self, X, y):
+        X, y = np.asarray(X), np.asarray(y)
+        if not self.regression:
+            self.classes = np.unique(y)
+        seeds = np.random.SeedSequence(self.rng).spawn(self.n_models)
+        with shared_arrays(X=X, y=y) as specs:
+            with ProcessPoolExecutor(self.n_jobs, initializer=_attach_shared, initargs=(specs,)) as pool:
+                fitted = list(pool.map(_fit_bagged, [self.model] * self.n_models, seeds,
+                                       [len(X)] * self.n_models))
+        self.models = [m for m, _ in fitted]
+        self.oob = [idx for _, idx in fitted]
+        self._oob_curve(X, y)
+        return self
+
+    def _votes(self, pred):
+        # each base prediction as a row of class votes, so averaging gives G(m)
+        return (pred[:, None] == self.classes[None, :]).astype(float)
+
+    def _oob_curve(self, X, y):
+        total = np.zeros(len(X) if self.regression else (len(X), len(self.classes)))
+        seen = np.zeros(len(X))
+        self.oob_errors = []
+        for model, idx in zip(self.models, self.oob):
+            pred = model.predict(X[idx])
+            total[idx] += pred if self.regression else self._votes(pred)
+            seen[idx] += 1
+            have = seen > 0
+            if self.regression:
+                err = ((total[have] / seen[have] - y[have])**2).mean()
+            else:
+                err = (self.classes[total[have].argmax(1)] != y[have]).mean()
+            self.oob_errors.append(err)
+        self.oob_error = self.oob_errors[-1]
+
+    def base_predictions(self, X):
+        return np.stack([model.predict(X) for model in self.models])
+
+    def predict(self, X):
+        P = self.base_predictions(X)
+        if self.regression:
+            return P.mean(0)
+        votes = sum(self._votes(p) for p in P)
+        return self.classes[votes.argmax(1)]
+
+    def variance_curve(self, X, y, max_rows=10_000, rng=None):
+        if len(X) > max_rows:
+            keep = np.random.default_rng(rng).choice(len(X), max_rows, replace=False)
+            X, y = X[keep], y[keep]
+        P = self.base_predictions(X)
+        errors = P - y if self.regression else (P != y).astype(float)
+        sigma2 = errors.var(1).mean()
+        C = np.corrcoef(errors)
+        M = len(self.models)
+        rho = (np.nansum(C) - np.nansum(np.diag(C))) / (M * (M - 1))
+        Ms = np.arange(1, M + 1)
+        return {
+            "sigma2": sigma2,
+            "rho": rho,
+            "floor": rho * sigma2,
+            "predicted": rho * sigma2 + (1 - rho) * sigma2 / Ms,
+            "observed": (np.cumsum(errors, 0) / Ms[:, None]).var(1),
+        }
+
+#%% [python]
+y_reg = np.sin(2 * X[:, 0]) + X[:, 1]**2 + 0.3 * rng.normal(size=len(X))
+bag = Bagging(DecisionTree("squared", min_samples_leaf=5), n_models=30, regression=True, rng=0)
+bag.fit(X[:10_000], y_reg[:10_000])
+curve = bag.variance_curve(X[15_000:], y_reg[15_000:])
+print(bag.oob_error, ((bag.predict(X[15_000:]) - y_reg[15_000:])**2).mean())
+print(curve["rho"], curve["floor"], curve["predicted"][[0, 9, 29]], curve["observed"][[0, 9, 29]])
+
+#%% [markdown]
+"""
+### Gradient Boosting
+
+Filling in the XGBoost details I skipped over above. Boosting fits the trees 
+one after another, and the "errors of the last" is really the gradient of the 
+loss with respect to the current prediction `F(x)`. With a second-order Taylor
+expansion of the loss around `F`, using gradients `g[i]` and second 
+derivatives `h[i]`, each new tree solves a little regularized least squares 
+problem. A leaf with sums `G` and `H` over its points gets the value 
+
+```
+w = -G/(H + lambda)
+```
+
+and contributes `-(1/2)*G**2/(H + lambda)` to the loss. That last bit plugs 
+right into the tree builder as the "loss" of a region, with per-row stats 
+`(g, h, 1)` instead of class counts. Squared error has `g = F - y` and `h = 1`. 
+Logistic loss has `g = p - y` and `h = p*(1-p)`. 
+
+Things that make it fast: 
+
+- Bin the features once, and every round's tree reuses the same `uint8` 
+  matrix with the histogram splits. 
+- The gradient and hessian live in one preallocated buffer that gets 
+  overwritten in place each round. 
+- The tree builder already knows which training rows ended up in each leaf,
+  so the running prediction `F` for the training set is just updated for each
+  leaf's rows. We never re-predict the training set. The validation set's 
+  prediction is updated the same way, one new tree at a time. 
+- Early stopping: when the validation loss hasn't improved in a while, stop,
+  and keep the trees up to the best round. 
+"""
+
+#%% [python]
+class GradientTree(HistDecisionTree):
+    def __init__(self, max_depth=6, min_samples_leaf=20, max_nodes=None, reg_lambda=1.0, gamma=0.0,
+                 max_features=None, rng=None, categorical=None, max_bins=256):
+        super().__init__("gradient", max_depth, min_samples_leaf, max_nodes, gamma, max_features, rng,
+                         categorical, max_bins)
+        self.reg_lambda = reg_lambda
+
+    @property
+    def regression(self):
+        return True
+
+    def _loss(self, stats):
+        return -0.5 * stats[..., 0]**2 / (stats[..., 1] + self.reg_lambda)
+
+    def _count(self, stats):
+        return stats[..., 2]
+
+    def _category_orders(self, stats):
+        return [stats[:, 0] / (stats[:, 1] + self.reg_lambda)]
+
+    def _make_node(self, stats, depth):
+        value = -stats[0] / (stats[1] + self.reg_lambda)
+        return Node(value, stats[2], self._loss(stats), depth)
+
+    def _finish_leaf(self, node, state):
+        node.rows = state[0]
+
+    def fit(self, bins, edges, T):
+        # T holds (g, h, 1) per row; gamma is an absolute gain threshold here
+        self._bins, self.bin_edges = bins, edges
+        self.n_train, self.n_features = 1, bins.shape[1]
+        self._rng = np.random.default_rng(self.rng)
+        self._n_features_per_node = self._n_candidates()
+        idx = np.arange(len(bins))
+        self._grow(None, T, (idx, self._histogram(T, idx)), T.sum(0))
+        del self._bins
+        return self
+
+
+class GradientBoosting:
+    def __init__(self, loss="squared", n_rounds=100, learning_rate=0.1, max_depth=6, max_nodes=None,
+                 min_samples_leaf=20, reg_lambda=1.0, gamma=0.0, max_bins=256, early_stopping_rounds=10,
+                 categorical=None):
+        self.loss = loss
+        self.n_rounds = n_rounds
+        self.learning_rate = learning_rate
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.min_samples_leaf = min_samples_leaf
+        self.reg_lambda = reg_lambda
+        self.gamma = gamma
+        self.max_bins = max_bins
+        self.early_stopping_rounds = early_stopping_rounds
+        self.categorical = categorical
+
+    def _gradients(self, y, F, T):
+        g, h = T[:, 0], T[:, 1]
+        if self.loss == "squared":
+            np.subtract(F, y, out=g)
+            h[:] = 1.0
+        elif self.loss == "logistic":
+            np.negative(F, out=g)
+            np.exp(g, out=g)
+            g += 1
+            np.reciprocal(g, out=g)     # p
+            np.subtract(1, g, out=h)
+            h *= g                      # p*(1-p)
+            g -= y
+        else:
+            raise ValueError(f"unknown loss {self.loss!r}")
+
+    def _loss_value(self, y, F):
+        if self.loss == "squared":
+            return ((F - y)**2).mean()
+        return (np.logaddexp(0, F) - y * F).mean()
+
+    def fit(self, X, y, X_val=None, y_val=None):
+        X, y = np.asarray(X, dtype=float), np.asarray(y, dtype=float)
+        bins, edges = bin_features(X, self.max_bins, self.categorical or ())
+        if self.loss == "logistic":
+            self.base = np.log(y.mean() / (1 - y.mean()))
+        else:
+            self.base = y.mean()
+        F = np.full(len(X), self.base)
+        T = np.empty((len(X), 3))
+        T[:, 2] = 1.0
+        validate = X_val is not None
+        if validate:
+            F_val = np.full(len(X_val), self.base)
+        self.trees, self.val_losses = [], []
+        best, best_round = np.inf, 0
+        for r in range(self.n_rounds):
+            self._gradients(y, F, T)
+            tree = GradientTree(self.max_depth, self.min_samples_leaf, self.max_nodes, self.reg_lambda,
+                                self.gamma, categorical=self.categorical,
+                                max_bins=self.max_bins).fit(bins, edges, T)
+            for node in tree.nodes():
+                node.value *= self.learning_rate
+                if node.is_leaf:
+                    F[node.rows] += node.value
+                    del node.rows
+            self.trees.append(tree)
+            if validate:
+                F_val += tree.predict(X_val)
+                self.val_losses.append(self._loss_value(y_val, F_val))
+                if self.val_losses[-1] < best:
+                    best, best_round = self.val_losses[-1], r
+                elif r - best_round >= self.early_stopping_rounds:
+                    break
+        if validate:
+            self.trees = self.trees[:best_round + 1]
+        self.best_round = best_round if validate else len(self.trees) - 1
+        return self
+
+    def decision_function(self, X):
+        return self.base + sum(tree.predict(X) for tree in self.trees)
+
+    def predict_proba(self, X):
+        return 1 / (1 + np.exp(-self.decision_function(X)))
+
+    def predict(self, X):
+        if self.loss == "logistic":
+            return (self.decision_function(X) > 0).astype(int)
+        return self.decision_function(X)
+
+#%% [python]
+gbm = GradientBoosting(loss="logistic", n_rounds=200, max_depth=4, learning_rate=0.2)
+gbm.fit(X[:10_000], y[:10_000], X[10_000:15_000], y[10_000:15_000])
+print(gbm.best_round, len(gbm.trees), (gbm.predict(X[15_000:]) == y[15_000:]).mean())
+
+#%% [markdown]
+"""
+### Compiling Trees for Prediction
+
+About that `O(d)` test time: it's true, but walking `Node` objects in Python 
+costs a lot per step, and a forest is hundreds of trees. Instead, flatten every
+tree into a handful of arrays indexed by node number: `feature`, `threshold`,
+`left`, `right`, and `value`. A leaf points back to itself with a threshold of
+infinity, so it stays put once reached. 
+
+Then prediction doesn't walk anything. Keep an array of "which node is each
+row at", all starting at the root. At each level, gather each row's feature 
+value for its current node, compare to the threshold, and jump to `left` or
+`right`. Every row moves down a level in one vectorized step, and after the
+tree's depth worth of steps, everybody's sitting at a leaf. Read off the leaf 
+values, and average them over the trees (forest) or add them up (boosting). 
+
+The flat arrays are also tiny and cheap to ship around, unlike a big graph of
+`Node` objects, so for really big inputs the rows get cut into chunks and the
+chunks get scored in parallel, with `X` in shared memory. 
+"""
+
+#%% [python]
+class FlatForest:
+    def __init__(self, feature, threshold, left, right, value, roots, depths, combine="mean", base=0.0,
+                 classes=None, category_row=None, category_mask=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.depths = depths
+        self.combine = combine
+        self.base = base
+        self.classes = classes
+        # categorical nodes point at a row of category_mask, the codes that go left
+        self.category_row = category_row
+        self.category_mask = category_mask
+        # left and right interleaved, so the next node is children[2*node + go_right]
+        self.children = np.stack([left, right], 1).ravel()
+
+    @classmethod
+    def from_trees(cls, trees, combine="mean", base=0.0):
+        features, thresholds, lefts, rights, values, roots, depths = [], [], [], [], [], [], []
+        category_row, category_sets = [], []
+        offset = 0
+        for tree in trees:
+            nodes = list(tree.nodes())
+            number = {id(node): offset + k for k, node in enumerate(nodes)}
+            roots.append(offset)
+            depths.append(max(node.depth for node in nodes))
+            for k, node in enumerate(nodes):
+                category_row.append(-1 if node.categories is None else len(category_sets))
+                if node.categories is not None:
+                    category_sets.append(node.categories)
+                if node.is_leaf:
+                    features.append(0)
+                    thresholds.append(np.inf)
+                    lefts.append(offset + k)
+                    rights.append(offset + k)
+                else:
+                    features.append(node.feature)
+                    thresholds.append(np.nan if node.threshold is None else node.threshold)
+                    lefts.append(number[id(node.left)])
+                    rights.append(number[id(node.right)])
+                v = np.atleast_1d(node.value).astype(float)
+                values.append(v if tree.regression else v / v.sum())
+            offset += len(nodes)
+        category_mask = None
+        if category_sets:
+            category_mask = np.zeros((len(category_sets), max(c.max() for c in category_sets) + 1), dtype=bool)
+            for r, codes in enumerate(category_sets):
+                category_mask[r, codes] = True
+        return cls(np.array(features, dtype=np.intp), np.array(thresholds),
+                   np.array(lefts, dtype=np.intp), np.array(rights, dtype=np.intp),
+                   np.array(values), np.array(roots, dtype=np.intp), np.array(depths), combine, base,
+                   None if trees[0].regression else trees[0].classes,
+                   np.array(category_row, dtype=np.intp), category_mask)
+
+    def _go_right(self, x, node):
+        # written as not-less-than so NaN goes right, same as Node.goes_left
+        go_right = ~(x < self.threshold[node])
+        if self.category_mask is not None:
+            row = self.category_row[node]
+            cat = np.flatnonzero(row >= 0)
+            if cat.size:
+                known = (x[cat] >= 0) & (x[cat] < self.category_mask.shape[1])
+                go_left = np.zeros(cat.size, dtype=bool)
+                go_left[known] = self.category_mask[row[cat[known]], x[cat[known]].astype(np.intp)]
+                go_right[cat] = ~go_left
+        return go_right
+
+    def _raw_chunk(self, X):
+        flat_x = X.ravel()
+        row_start = np.arange(len(X)) * X.shape[1]
+        total = np.zeros((len(X), self.value.shape[1]))
+        for root, depth in zip(self.roots, self.depths):
+            node = np.full(len(X), root, dtype=np.intp)
+            for _ in range(depth):
+                go_right = self._go_right(flat_x[row_start + self.feature[node]], node)
+                node = self.children[2 * node + go_right]
+            total += self.value[node]
+        return total / len(self.roots) if self.combine == "mean" else total
+
+    def raw(self, X, chunk=250_000, n_jobs=1):
+        X = np.ascontiguousarray(X, dtype=float)
+        starts = range(0, len(X), chunk)
+        if n_jobs == 1 or len(starts) == 1:
+            out = np.concatenate([self._raw_chunk(X[i:i + chunk]) for i in starts])
+        else:
+            # the forest goes to each worker once, through the initializer, not with every chunk
+            with shared_arrays(X=X) as specs:
+                with ProcessPoolExecutor(n_jobs, initializer=_attach_flat, initargs=(specs, self)) as pool:
+                    out = np.concatenate(list(pool.map(_flat_chunk, starts, [chunk] * len(starts))))
+        return out + self.base
+
+    def predict(self, X, n_jobs=1):
+        raw = self.raw(X, n_jobs=n_jobs)
+        if self.classes is not None:
+            return self.classes[raw.argmax(1)]
+        return raw[:, 0]
+
+
+_flat_forest = None
+
+def _attach_flat(specs, flat):
+    global _flat_forest
+    _attach_shared(specs)
+    _flat_forest = flat
+
+
+def _flat_chunk(start, chunk):
+    return _flat_forest._raw_chunk(_shared["X"][1][start:start + chunk])
+
+
+def compile_model(model):
+    if isinstance(model, DecisionTree):
+        return FlatForest.from_trees([model])
+    if isinstance(model, RandomForest):
+        return FlatForest.from_trees(model.trees)
+    if isinstance(model, GradientBoosting):
+        return FlatForest.from_trees(model.trees, combine="sum", base=model.base)
+    raise TypeError(f"don't know how to compile a {type(model).__name__}")
+
+#%% [python]
+flat_forest = compile_model(forest)
+print((flat_forest.predict(X) == forest.predict(X)).mean(), np.abs(flat_forest.raw(X) - forest.predict_proba(X)).max())
+flat_gbm = compile_model(gbm)
+print(np.abs(flat_gbm.raw(X)[:, 0] - gbm.decision_function(X)).max())
+
+# missing values have to take the same branch as in the Node trees (right, since NaN < t is False)
+X_nan = np.where(rng.random(X.shape) < 0.3, np.nan, X)
+print((compile_model(tree).predict(X_nan) == tree.predict(X_nan)).mean(),
+      np.abs(flat_gbm.raw(X_nan)[:, 0] - gbm.decision_function(X_nan)).max())
+
+#%% [markdown]
+"""
+### Categorical Splits
+
+So far every feature is a number and a split is `x < t`. For a categorical 
+feature with `q` levels (zip code, product id, ...) the natural split is "is 
+`x` in this subset of levels", and there are `2^(q-1) - 1` subsets. Trying 
+them all is hopeless past `q` of 20 or so. One-hot encoding dodges that, but 
+then each split peels off a single level, so the tree has to be way deeper to
+say the same thing. 
+
+The trick (Fisher for regression, Breiman et al. for two classes) is that you
+don't need all the subsets. Sort the levels by their mean target (or `p_1`, or 
+`G / (H + lambda)` for boosting), and the best subset is always a prefix of 
+that order. So it's the usual threshold scan over `q` sorted "positions", and 
+the whole thing is `O(q log q)` per node on top of one `bincount` to get the 
+per-level counts. The prefix result isn't true for more than two classes, so 
+there we try `C` orders (each level sorted by `p_c` for each class, one versus
+the rest) and keep the best. That isn't guaranteed optimal, but it's bounded 
+and usually close. 
+
+The features need to be integer-coded `0, ..., q - 1` and listed in 
+`categorical`. A node stores the set of codes that go left, and anything 
+else (including levels never seen in training) goes right. The histogram 
+trees give each level its own bin, which is fine up to `max_bins - 1` 
+levels. Past that (zip codes, SKUs), the most frequent `max_bins - 1` levels 
+keep their own bins, and all the rare ones share the last bin with any level
+that shows up later. A tree can't tell the rare levels apart, but there's 
+not much data on any one of them anyway. That shared bin always goes right, 
+so it lines up with "not listed" at prediction time. 
+"""
+
+#%% [python]
+# way more levels than bins, with a long tail of rare ones
+n_levels = 2000
+level_effect = rng.normal(size=n_levels)
+level_p = 1 / np.arange(1, n_levels + 1)
+X_cat = np.column_stack([rng.choice(n_levels, size=20_000, p=level_p / level_p.sum()), rng.normal(size=20_000)])
+y_cat = level_effect[X_cat[:, 0].astype(int)] + 0.5 * X_cat[:, 1] + rng.normal(scale=0.3, size=20_000)
+
+for categorical in [(), (0,)]:
+    cat_tree = DecisionTree(criterion="squared", max_depth=6, min_samples_leaf=20,
+                            categorical=categorical).fit(X_cat[:10_000], y_cat[:10_000])
+    cat_gbm = GradientBoosting(n_rounds=100, max_depth=3, categorical=categorical).fit(X_cat[:10_000], y_cat[:10_000])
+    print(categorical, ((cat_tree.predict(X_cat[10_000:]) - y_cat[10_000:]) ** 2).mean(),
+          ((cat_gbm.predict(X_cat[10_000:]) - y_cat[10_000:]) ** 2).mean(),
+          np.abs(compile_model(cat_gbm).raw(X_cat[10_000:])[:, 0] - cat_gbm.decision_function(X_cat[10_000:])).max())
+
+#%% [markdown]
+"""
+### Cost-Complexity Pruning
+
+The `prune` above is reduced-error pruning: collapse anything the validation 
+set doesn't like. CART does option 5 a bit more carefully. Penalize the 
+training error by the number of leaves, `R(T) + alpha*|T|`, and as `alpha` 
+goes from 0 up, the best subtree loses leaves one weakest link at a time, so 
+there's a nested sequence of subtrees, one per breakpoint in `alpha`. Then 
+the validation set picks which one to keep. 
+
+The textbook way to get the sequence is to recompute every node's "weakest 
+link" score after every collapse and re-score the validation set for each 
+candidate tree, which is `O(nodes*n_val)` and worse. But the best cost of a 
+node's subtree, as a function of `alpha`, is piecewise linear: each piece is
+one subtree with some training error and leaf count. So go bottom-up once. 
+A leaf is one piece. A split adds up its children's pieces (merging their 
+breakpoints), and then finds the `alpha` where just being a leaf, `R(t) + 
+alpha`, gets cheaper, and cuts the list off there. The validation error 
+rides along in the same pieces, since it also just adds up over leaves. 
+What comes out at the root is the whole pruning sequence with the validation
+error of every tree in it, off of routing the validation set through the 
+tree exactly once. 
+"""
+
+#%% [python]
+for method in ["reduced_error", "cost_complexity"]:
+    pruned = DecisionTree(criterion="entropy", max_depth=8, min_samples_leaf=20).fit(X[:10_000], y[:10_000])
+    path = pruned.pruning_path(X[10_000:15_000], y[10_000:15_000])
+    pruned.prune(X[10_000:15_000], y[10_000:15_000], method=method)
+    print(method, len(path), pruned.n_nodes, (pruned.predict(X[15_000:]) == y[15_000:]).mean())
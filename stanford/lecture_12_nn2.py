@@ -250,3 +250,446 @@ updates in that direction will tend to be very small.
 
 """
 
+#%% [markdown]
+"""
+### Backprop in Code
+
+Running all of that for real, for any number of layers. In matrix form, for a
+batch of `m` rows stacked in `A**{0}`, each layer is `Z**{l} = A**{l-1} W**{l} + b**{l}`
+and `A**{l} = g(Z**{l})`. Going backwards, with `delta**{l} = dJ/dZ**{l}`:
+
+* `dJ/dW**{l} = A**({l-1}*T) delta**{l}`, and `dJ/db**{l}` is `delta**{l}` summed over rows.
+* `delta**{l-1} = (delta**{l} W**({l}*T)) * g'(Z**{l-1})`, element-wise.
+* At the output, pairing sigmoid with the log loss (or softmax with cross entropy,
+    or identity with squared error) makes `delta = (A**{L} - y)/m`, which is the
+    `(a**{3} - y)` from above. 
+
+And the TA's point: every `g'` here can be written in terms of `A` alone 
+(`a(1-a)` for sigmoid, `1-a**2` for tanh, `a > 0` for ReLU), so caching the 
+activations from the forward pass is all backprop needs. 
+
+The other thing that matters for speed on small networks is not allocating. 
+Every `A**{l}`, `delta**{l}`, and gradient has a fixed shape once the batch size 
+is fixed, so those buffers are made once per batch size and written into with
+`out=` on every step after that. All the weights and biases live in one flat
+`params` vector (and the gradients in a matching flat `grads`), with each 
+layer's `W` and `b` as reshaped views into it, so a gradient step is one 
+vectorized update over the whole network. 
+"""
+
+#%% [python]
+import numpy as np
+
+def _sigmoid(z, out):
+    np.negative(z, out=out)
+    np.exp(out, out=out)
+    out += 1
+    return np.reciprocal(out, out=out)
+
+def _sigmoid_grad(a, out):
+    np.subtract(1, a, out=out)
+    return np.multiply(out, a, out=out)
+
+def _tanh_grad(a, out):
+    np.square(a, out=out)
+    return np.subtract(1, out, out=out)
+
+def _identity(z, out):
+    np.copyto(out, z)
+    return out
+
+def _identity_grad(a, out):
+    out.fill(1)
+    return out
+
+def _softmax(z, out):
+    np.subtract(z, z.max(1, keepdims=True), out=out)
+    np.exp(out, out=out)
+    out /= out.sum(1, keepdims=True)
+    return out
+
+# name: (g(z) written into out, g'(z) from a = g(z) written into out)
+ACTIVATIONS = {
+    "sigmoid": (_sigmoid, _sigmoid_grad),
+    "tanh": (lambda z, out: np.tanh(z, out=out), _tanh_grad),
+    "relu": (lambda z, out: np.maximum(z, 0, out=out), lambda a, out: np.greater(a, 0, out=out)),
+    "identity": (_identity, _identity_grad),
+    "softmax": (_softmax, None),
+}
+
+
+class Network:
+    def __init__(self, sizes, activation="relu", output="sigmoid", dtype=np.float64, rng=None):
+        # output sigmoid -> log loss, softmax -> cross entropy, identity -> squared error
+        self.sizes = list(sizes)
+        self.activations = [activation] * (len(sizes) - 2) + [output]
+        self.dtype = dtype
+        shapes = [(n_in, n_out) for n_in, n_out in zip(sizes[:-1], sizes[1:])]
+        self.params = np.zeros(sum(n_in * n_out + n_out for n_in, n_out in shapes), dtype=dtype)
+        self.grads = np.zeros_like(self.params)
+        self.W, self.b, self.dW, self.db = self._views(self.params) + self._views(self.grads)
+        rng = np.random.default_rng(rng)
+        for W, act in zip(self.W, self.activations):
+            # He for ReLU, Xavier otherwise
+            scale = np.sqrt((2.0 if act == "relu" else 1.0) / W.shape[0])
+            W[:] = rng.normal(scale=scale, size=W.shape)
+        self._buffers = {}
+
+    def _views(self, flat):
+        Ws, bs, start = [], [], 0
+        for n_in, n_out in zip(self.sizes[:-1], self.sizes[1:]):
+            Ws.append(flat[start:start + n_in * n_out].reshape(n_in, n_out))
+            start += n_in * n_out
+            bs.append(flat[start:start + n_out])
+            start += n_out
+        return Ws, bs
+
+    def _get_buffers(self, m):
+        # activations A[0..L], deltas and scratch for g' per layer, and the targets, made once per batch size
+        if m not in self._buffers:
+            A = [np.empty((m, n), dtype=self.dtype) for n in self.sizes]
+            delta = [np.empty((m, n), dtype=self.dtype) for n in self.sizes[1:]]
+            scratch = [np.empty((m, n), dtype=self.dtype) for n in self.sizes[1:-1]]
+            self._buffers[m] = A, delta, scratch, np.empty((m, self.sizes[-1]), dtype=self.dtype)
+        return self._buffers[m]
+
+    def forward(self, X):
+        # the returned array is a buffer, overwritten by the next forward of the same batch size
+        A = self._get_buffers(len(X))[0]
+        if X is not A[0]:
+            np.copyto(A[0], X)
+        for l, (W, b, act) in enumerate(zip(self.W, self.b, self.activations)):
+            np.matmul(A[l], W, out=A[l + 1])
+            A[l + 1] += b
+            ACTIVATIONS[act][0](A[l + 1], A[l + 1])
+        return A[-1]
+
+    def backward(self, y):
+        # gradients of the mean loss for the batch that was just forwarded, into self.grads
+        A, delta, scratch, _ = self._get_buffers(len(y))
+        np.subtract(A[-1], y.reshape(A[-1].shape), out=delta[-1])
+        delta[-1] /= len(y)
+        for l in range(len(self.W) - 1, -1, -1):
+            np.matmul(A[l].T, delta[l], out=self.dW[l])
+            delta[l].sum(0, out=self.db[l])
+            if l > 0:
+                np.matmul(delta[l], self.W[l].T, out=delta[l - 1])
+                delta[l - 1] *= ACTIVATIONS[self.activations[l - 1]][1](A[l], scratch[l - 1])
+        return self.grads
+
+    def loss(self, X, y):
+        a = self.forward(X)
+        y = y.reshape(a.shape)
+        eps = np.finfo(self.dtype).eps
+        if self.activations[-1] == "sigmoid":
+            return -np.sum(y * np.log(a + eps) + (1 - y) * np.log(1 - a + eps)) / len(a)
+        if self.activations[-1] == "softmax":
+            return -np.sum(y * np.log(a + eps)) / len(a)
+        return 0.5 * np.sum((a - y)**2) / len(a)
+
+    def predict(self, X, batch_size=4096):
+        return np.concatenate([self.forward(X[i:i + batch_size]).copy() for i in range(0, len(X), batch_size)])
+
+    def fit(self, X, y, epochs=10, batch_size=64, learning_rate=0.1, optimizer=None, rng=None):
+        rng = np.random.default_rng(rng)
+        X = np.asarray(X, dtype=self.dtype)
+        y = np.asarray(y, dtype=self.dtype).reshape(len(X), -1)
+        step = np.empty_like(self.params)
+        for _ in range(epochs):
+            order = rng.permutation(len(X))
+            for i in range(0, len(X), batch_size):
+                batch = order[i:i + batch_size]
+                # gather the batch straight into the input and target buffers
+                A, _, _, target = self._get_buffers(len(batch))
+                np.take(X, batch, axis=0, out=A[0])
+                np.take(y, batch, axis=0, out=target)
+                self.forward(A[0])
+                self.backward(target)
+                if optimizer is None:
+                    np.multiply(self.grads, learning_rate, out=step)
+                    self.params -= step
+                else:
+                    optimizer.step(self.params, self.grads)
+        return self
+
+#%% [python]
+rng = np.random.default_rng(0)
+X = rng.normal(size=(20_000, 2))
+y = (X[:, 0]**2 + X[:, 1]**2 < 1.4).astype(float)
+net = Network([2, 32, 32, 1], activation="tanh", rng=0)
+
+# finite-difference check of backward on a few rows
+net.forward(X[:50])
+grads = net.backward(y[:50, None]).copy()
+numeric = []
+for i in rng.choice(len(net.params), 10, replace=False):
+    net.params[i] += 1e-6
+    up = net.loss(X[:50], y[:50])
+    net.params[i] -= 2e-6
+    down = net.loss(X[:50], y[:50])
+    net.params[i] += 1e-6
+    numeric.append((grads[i], (up - down) / 2e-6))
+print(np.abs(np.diff(numeric, axis=1)).max())
+
+net.fit(X[:15_000], y[:15_000], epochs=20, batch_size=64, learning_rate=0.5, rng=0)
+print(((net.predict(X[15_000:])[:, 0] > 0.5) == y[15_000:]).mean())
+
+#%% [markdown]
+"""
+### Feeding Mini-Batches
+
+Mini-batch step 1, "select a batch", isn't free when the data doesn't fit in 
+memory. Say the training set is a big array of 64x64x3 images on disk. Then 
+every batch is a pile of random reads and a conversion to normalized floats, 
+and if that happens in between training steps, the training loop spends a lot
+of its time just waiting. 
+
+So the batches get made in a background thread while the network is busy 
+with the current one. The data is opened as a memory map (`np.load(..., 
+mmap_mode="r")`), so only the rows a batch asks for ever get read. Each epoch
+shuffles the row indices, and each batch's indices are sorted before reading
+so they come off the disk in file order (the order inside a batch doesn't 
+matter to the gradient). Finished batches go into a queue with a few slots. 
+A full queue makes the reader wait, so it can't run away with the memory, and
+the training loop only waits if the reader falls behind. Numpy lets go of the
+GIL while it copies rows and while it multiplies matrices, so a thread is 
+enough here. 
+"""
+
+#%% [python]
+import queue
+import threading
+
+class BatchLoader:
+    def __init__(self, X, y=None, batch_size=64, shuffle=True, prefetch=4, transform=None,
+                 drop_last=False, rng=None):
+        # X can be a path to a .npy file, which gets memory mapped; prefetch=0 reads in the loop
+        self.X = np.load(X, mmap_mode="r") if isinstance(X, str) else X
+        self.y = np.load(y, mmap_mode="r") if isinstance(y, str) else y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self.transform = transform
+        self.drop_last = drop_last
+        self.rng = np.random.default_rng(rng)
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.X) // self.batch_size
+        return -(-len(self.X) // self.batch_size)
+
+    def _batches(self):
+        order = self.rng.permutation(len(self.X)) if self.shuffle else np.arange(len(self.X))
+        for i in range(len(self)):
+            idx = np.sort(order[i * self.batch_size:(i + 1) * self.batch_size])
+            X = self.X[idx]
+            if self.transform is not None:
+                X = self.transform(X)
+            yield X if self.y is None else (X, np.asarray(self.y[idx]))
+
+    @staticmethod
+    def _put(item, out, stop):
+        # gives up once the training loop has stopped listening
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fill(self, batches, out, stop):
+        try:
+            for batch in batches:
+                if not self._put(batch, out, stop):
+                    return
+            self._put(StopIteration, out, stop)
+        except BaseException as e:
+            self._put(e, out, stop)
+
+    def __iter__(self):
+        if self.prefetch == 0:
+            yield from self._batches()
+            return
+        out = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._fill, args=(self._batches(), out, stop), daemon=True)
+        reader.start()
+        try:
+            while True:
+                batch = out.get()
+                if batch is StopIteration:
+                    return
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # also runs if the training loop breaks out early
+            stop.set()
+            reader.join()
+
+#%% [python]
+import os
+import tempfile
+import time
+
+store = os.path.join(tempfile.mkdtemp(), "images.npy")
+images = np.lib.format.open_memmap(store, mode="w+", dtype=np.uint8, shape=(8192, 64, 64, 3))
+for i in range(0, len(images), 1024):
+    images[i:i + 1024] = rng.integers(256, size=(1024, 64, 64, 3), dtype=np.uint8)
+labels = (images[:, :32].mean((1, 2, 3)) > images[:, 32:].mean((1, 2, 3))).astype(float)[:, None]
+images.flush()
+del images
+
+# normalize with the training mean and std, which would get saved along with the model
+mu, sigma = 127.5, 73.9
+normalize = lambda batch: (batch.reshape(len(batch), -1) - mu) / sigma
+image_net = Network([64 * 64 * 3, 64, 1], rng=0)
+for prefetch in [0, 4]:
+    start = time.perf_counter()
+    for Xb, yb in BatchLoader(store, labels, batch_size=128, prefetch=prefetch, transform=normalize, rng=0):
+        image_net.forward(Xb)
+        image_net.backward(yb)
+        image_net.params -= 0.01 * image_net.grads
+    print(prefetch, time.perf_counter() - start)
+
+# breaking out early, after the reader has already queued the end of the epoch, shuts it down
+batches = iter(BatchLoader(store, labels, batch_size=820, prefetch=4, transform=normalize))
+for _ in range(6):
+    next(batches)
+time.sleep(0.5)
+start = time.perf_counter()
+batches.close()
+print(threading.active_count(), time.perf_counter() - start)
+os.remove(store)
+
+#%% [markdown]
+"""
+### Optimizers
+
+Here's the momentum update from above, plus the other usual suspects:
+
+* Nesterov - momentum, but the step looks ahead: it uses `beta*v + (1-beta)*dL/dw`
+    (where the velocity is about to take us) instead of just `v`. 
+* RMSProp - keep a moving average `s` of the _squared_ gradient instead, and
+    divide each coordinate's step by `sqrt(s)`. Coordinates with big, noisy 
+    gradients take small steps, and flat ones take bigger steps. 
+* Adam - both: momentum's `v` on top, RMSProp's `s` on the bottom, with a 
+    correction for both averages starting at 0 (so they're biased small for 
+    the first few steps). 
+
+Every one of these is the same element-wise update applied to every weight, 
+so since the network keeps every weight in the one flat `params` vector, a 
+step is a handful of vectorized operations over the whole thing no matter how
+many layers there are. The optimizer's state (`v`, `s`) is the same size as 
+`params`, made on the first step and updated in place after that, along with a
+scratch vector, so a step doesn't allocate anything either. 
+"""
+
+#%% [python]
+class Optimizer:
+    def __init__(self, learning_rate):
+        self.learning_rate = learning_rate
+        self.t = 0
+        self._buffers = None
+
+    def _state(self, params, k):
+        # k zeroed vectors shaped like params, made on the first step
+        if self._buffers is None or self._buffers[0].shape != params.shape:
+            self._buffers = [np.zeros_like(params) for _ in range(k)]
+            self.t = 0
+        self.t += 1
+        return self._buffers
+
+    def _average(self, state, x, beta, scratch):
+        # state = beta*state + (1-beta)*x, in place
+        state *= beta
+        np.multiply(x, 1 - beta, out=scratch)
+        state += scratch
+
+
+class SGD(Optimizer):
+    def step(self, params, grads):
+        scratch, = self._state(params, 1)
+        np.multiply(grads, self.learning_rate, out=scratch)
+        params -= scratch
+
+
+class Momentum(Optimizer):
+    def __init__(self, learning_rate=0.1, beta=0.9, nesterov=False):
+        super().__init__(learning_rate)
+        self.beta = beta
+        self.nesterov = nesterov
+
+    def step(self, params, grads):
+        v, scratch = self._state(params, 2)
+        self._average(v, grads, self.beta, scratch)
+        if self.nesterov:
+            # step along beta*v + (1-beta)*dL/dw; scratch is still holding (1-beta)*dL/dw
+            scratch *= self.learning_rate
+            params -= scratch
+            np.multiply(v, self.learning_rate * self.beta, out=scratch)
+        else:
+            np.multiply(v, self.learning_rate, out=scratch)
+        params -= scratch
+
+
+class RMSProp(Optimizer):
+    def __init__(self, learning_rate=0.001, rho=0.9, eps=1e-8):
+        super().__init__(learning_rate)
+        self.rho = rho
+        self.eps = eps
+
+    def step(self, params, grads):
+        s, scratch = self._state(params, 2)
+        np.square(grads, out=scratch)
+        self._average(s, scratch, self.rho, scratch)
+        np.sqrt(s, out=scratch)
+        scratch += self.eps
+        np.divide(grads, scratch, out=scratch)
+        scratch *= self.learning_rate
+        params -= scratch
+
+
+class Adam(Optimizer):
+    def __init__(self, learning_rate=0.001, beta1=0.9, beta2=0.999, eps=1e-8):
+        super().__init__(learning_rate)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+
+    def step(self, params, grads):
+        v, s, scratch = self._state(params, 3)
+        self._average(v, grads, self.beta1, scratch)
+        np.square(grads, out=scratch)
+        self._average(s, scratch, self.beta2, scratch)
+        # fold both bias corrections into the step size and eps
+        correction = np.sqrt(1 - self.beta2**self.t)
+        np.sqrt(s, out=scratch)
+        scratch += self.eps * correction
+        np.divide(v, scratch, out=scratch)
+        scratch *= self.learning_rate * correction / (1 - self.beta1**self.t)
+        params -= scratch
+
+#%% [python]
+optimizers = {"sgd": SGD(0.5), "momentum": Momentum(0.5), "nesterov": Momentum(0.5, nesterov=True),
+              "rmsprop": RMSProp(0.003), "adam": Adam(0.003)}
+for name, optimizer in optimizers.items():
+    net = Network([2, 32, 32, 1], activation="tanh", rng=0)
+    net.fit(X[:15_000], y[:15_000], epochs=5, batch_size=64, optimizer=optimizer, rng=0)
+    print(name, net.loss(X[15_000:], y[15_000:]), ((net.predict(X[15_000:])[:, 0] > 0.5) == y[15_000:]).mean())
+
+# many small layers: one step over the flat vector vs a loop over the layers
+deep = Network([16] + [16] * 50 + [1], rng=0)
+deep.grads[:] = rng.normal(size=deep.grads.shape)
+adam = Adam()
+start = time.perf_counter()
+for _ in range(1000):
+    adam.step(deep.params, deep.grads)
+flat_time = time.perf_counter() - start
+per_layer = [(p, g, Adam()) for p, g in zip(deep.W + deep.b, deep.dW + deep.db)]
+start = time.perf_counter()
+for _ in range(1000):
+    for p, g, layer_adam in per_layer:
+        layer_adam.step(p, g)
+print(flat_time, time.perf_counter() - start)
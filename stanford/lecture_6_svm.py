@@ -276,3 +276,109 @@ non-trivial, but this alternative expression _is_ convex and thus is much easier
 to solve. 
 """
 
+
+#%% [markdown]
+"""
+### Solving It
+
+Lecture 7 goes through the dual of this problem, but I wanted to see it actually
+solve. For the separable linear case, the dual is
+
+```
+min_alpha (1/2)*abs(abs(Sigma[i]*alpha[i]*y[i]*x[i]))**2 - Sigma[i]*alpha[i]
+s.t. alpha[i] >= 0, Sigma[i]*y[i]*alpha[i] == 0
+```
+
+and `w = Sigma[i]*alpha[i]*y[i]*x[i]`. The equality constraint means we can't 
+move one `alpha` at a time, so the trick (SMO, Platt) is to move two at once, 
+picking the pair that violates the optimality conditions the most. If we keep
+`w` around explicitly, the gradient for every point is just 
+`y[i]*w**T*x[i] - 1`, and each pair update only changes `w` along two rows. 
+
+The nice part is warm starts. If we add a handful of new rows, the old `alpha`
+plus zeros for the new rows is still feasible, and usually most of the way to
+optimal already. Only the new points that violate the margin need any work. 
+"""
+
+#%% [python]
+import numpy as np
+
+class HardMarginSVM:
+    def __init__(self, tol=1e-6, max_iter=100_000):
+        self.tol = tol
+        self.max_iter = max_iter
+        self.alpha = None
+
+    def fit(self, X, y, warm_start=False):
+        n = len(X)
+        alpha = np.zeros(n)
+        if warm_start and self.alpha is not None:
+            # assumes new rows were appended after the old ones
+            alpha[:len(self.alpha)] = self.alpha
+        w = (alpha * y) @ X
+        G = y * (X @ w) - 1
+        sq = (X**2).sum(1)
+        pos = y > 0
+        for it in range(self.max_iter):
+            # maximal violating pair, with no upper bound on alpha
+            score = -y * G
+            up = pos | (alpha > 0)
+            low = ~pos | (alpha > 0)
+            i = np.flatnonzero(up)[score[up].argmax()]
+            j = np.flatnonzero(low)[score[low].argmin()]
+            m, M = score[i], score[j]
+            if m - M < self.tol:
+                break
+            quad = max(sq[i] + sq[j] - 2 * X[i] @ X[j], 1e-12)
+            ai, aj = alpha[i], alpha[j]
+            if y[i] != y[j]:
+                delta = (-G[i] - G[j]) / quad
+                diff = ai - aj
+                ai, aj = ai + delta, aj + delta
+                if diff > 0 and aj < 0:
+                    ai, aj = diff, 0.0
+                elif diff <= 0 and ai < 0:
+                    ai, aj = 0.0, -diff
+            else:
+                delta = (G[i] - G[j]) / quad
+                total = ai + aj
+                ai, aj = ai - delta, aj + delta
+                if aj < 0:
+                    ai, aj = total, 0.0
+                elif ai < 0:
+                    ai, aj = 0.0, total
+            dw = (ai - alpha[i]) * y[i] * X[i] + (aj - alpha[j]) * y[j] * X[j]
+            alpha[i], alpha[j] = ai, aj
+            w += dw
+            G += y * (X @ dw)
+        self.converged = m - M < self.tol
+        self.n_iter = it
+        self.alpha = alpha
+        self.w = w
+        self.b = (m + M) / 2
+        return self
+
+    def decision_function(self, X):
+        return X @ self.w + self.b
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) >= 0, 1, -1)
+
+    def margins(self, X, y):
+        # functional margins gamma[i], geometric margins Gamma[i], and Gamma for the set
+        gamma = y * self.decision_function(X)
+        Gamma = gamma / np.linalg.norm(self.w)
+        return gamma, Gamma, Gamma.min()
+
+#%% [python]
+rng = np.random.default_rng(0)
+X = rng.normal(size=(2000, 2))
+y = np.where(X @ [1.0, -2.0] + 0.5 > 0, 1, -1)
+# push the first 1950 off the boundary; the last 50 aren't, so some of them land inside the old margin
+X[:1950] += 0.2 * y[:1950, None] * np.array([1.0, -2.0]) / np.sqrt(5)
+
+svm = HardMarginSVM().fit(X[:1950], y[:1950])
+print((svm.margins(X[1950:], y[1950:])[0] < 1).sum(), "new rows violate the old margin")
+cold = HardMarginSVM().fit(X, y)
+warm = svm.fit(X, y, warm_start=True)
+print(cold.n_iter, warm.n_iter, cold.margins(X, y)[2], warm.margins(X, y)[2])
@@ -303,3 +303,402 @@ All interaction terms, but with a normal distribution flavor now.
 def K(x,z):
     return e**(-abs(abs(x-z))**2/(2*sigma**2))
 K
+
+#%% [markdown]
+"""
+### Kernels in Code
+
+Quick aside, because I wanted to actually play with these. Every one of the
+kernels above can be computed for a whole block of points at once. If `X` is
+`n x f` and `Z` is `m x f`, the Gram matrix `K[i,j] = K(x[i], z[j])` is just
+a matrix product plus some elementwise stuff. The Gaussian one uses the fact 
+that `abs(abs(x-z))**2 = x**T*x + z**T*z - 2*x**T*z`, so it's one matmul too. 
+"""
+
+#%% [python]
+import numpy as np
+
+def linear_kernel(X, Z):
+    return X @ Z.T
+
+def polynomial_kernel(X, Z, d=2, c=0.0):
+    return (X @ Z.T + c)**d
+
+def gaussian_kernel(X, Z, sigma=1.0):
+    sq = (X**2).sum(1)[:, None] + (Z**2).sum(1)[None, :] - 2 * X @ Z.T
+    return np.exp(-np.maximum(sq, 0) / (2 * sigma**2))
+
+#%% [markdown]
+"""
+### Nyström Approximation
+
+The catch with all of this is the full kernel matrix is `n x n`. At 100k points
+that's 80GB of float64, so the "no extra computation" promise runs out pretty
+quick. The Nyström trick is to pick `m << n` landmark points `Z` and pretend 
+the kernel is low rank through them
+
+```
+K ~= K[n,m] * K[m,m]**-1 * K[m,n]
+```
+
+If we factor `K[m,m]**-1 = M*M**T` once, then `phi(x) = K(x,Z)*M` is an 
+explicit `m`-dimensional feature map, and `phi(x)**T*phi(z)` approximates 
+`K(x,z)`. Now any linear method (linear SVM, ridge) on `phi` is approximately
+the kernelized version, with `O(n*m)` memory instead of `O(n**2)`.
+
+Landmarks can be picked uniformly at random, or seeded with k-means so they 
+actually cover the data. k-means is usually a better approximation for the 
+same `m`. To check we haven't lost too much, we compare the exact and 
+approximate kernel on a held-out sample. 
+"""
+
+#%% [python]
+def kmeans_landmarks(X, m, iters=10, rng=None):
+    rng = np.random.default_rng(rng)
+    # k-means++ seeding, then a few rounds of Lloyd
+    Z = np.empty((m, X.shape[1]))
+    Z[0] = X[rng.integers(len(X))]
+    d2 = ((X - Z[0])**2).sum(1)
+    for k in range(1, m):
+        Z[k] = X[rng.choice(len(X), p=d2 / d2.sum())] if d2.sum() > 0 else X[rng.integers(len(X))]
+        d2 = np.minimum(d2, ((X - Z[k])**2).sum(1))
+    for _ in range(iters):
+        labels = (-2 * X @ Z.T + (Z**2).sum(1)).argmin(1)
+        counts = np.bincount(labels, minlength=m)
+        sums = np.zeros_like(Z)
+        np.add.at(sums, labels, X)
+        keep = counts > 0
+        Z[keep] = sums[keep] / counts[keep, None]
+    return Z
+
+
+class Nystrom:
+    def __init__(self, m, kernel=gaussian_kernel, landmarks="uniform", rng=None, **kernel_args):
+        self.m = m
+        self.kernel = kernel
+        self.landmarks = landmarks
+        self.rng = rng
+        self.kernel_args = kernel_args
+
+    def K(self, X, Z):
+        return self.kernel(X, Z, **self.kernel_args)
+
+    def fit(self, X):
+        rng = np.random.default_rng(self.rng)
+        m = min(self.m, len(X))
+        if self.landmarks == "uniform":
+            self.Z = X[rng.choice(len(X), m, replace=False)]
+        elif self.landmarks == "kmeans":
+            self.Z = kmeans_landmarks(X, m, rng=rng)
+        else:
+            raise ValueError(f"unknown landmark method {self.landmarks!r}")
+        # K[m,m] = U*diag(s)*U**T  ->  M = U*diag(s**-1/2), dropping the null space
+        s, U = np.linalg.eigh(self.K(self.Z, self.Z))
+        keep = s > s.max() * 1e-10
+        self.M = U[:, keep] / np.sqrt(s[keep])
+        return self
+
+    def transform(self, X, batch=10_000):
+        out = np.empty((len(X), self.M.shape[1]))
+        for i in range(0, len(X), batch):
+            out[i:i + batch] = self.K(X[i:i + batch], self.Z) @ self.M
+        return out
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def error(self, X_holdout, sample=500, rng=None):
+        rng = np.random.default_rng(rng)
+        S = X_holdout[rng.choice(len(X_holdout), min(sample, len(X_holdout)), replace=False)]
+        K_exact = self.K(S, S)
+        phi = self.transform(S)
+        diff = K_exact - phi @ phi.T
+        return {
+            "relative_frobenius": np.linalg.norm(diff) / np.linalg.norm(K_exact),
+            "max_abs": np.abs(diff).max(),
+        }
+
+#%% [python]
+X = np.random.default_rng(0).normal(size=(2000, 5))
+for method in ["uniform", "kmeans"]:
+    ny = Nystrom(100, landmarks=method, rng=0, sigma=2.0).fit(X[:1500])
+    print(method, ny.error(X[1500:], rng=0))
+
+#%% [markdown]
+"""
+### Checking Mercer Empirically
+
+Back to Mercer's theorem. We can't check "for any d points", but we can sample
+a bunch of point sets and see if the kernel matrix ever fails to be PSD. If we
+find one that isn't, the kernel is definitely invalid. If we never do, it's 
+at least evidence. 
+
+The cheap test for PSD is to just attempt a Cholesky factorization. It fails
+exactly when the matrix isn't (numerically) positive definite, so we add a tiny
+bit of jitter on the diagonal to let through the PSD-but-singular ones, which
+happens a lot with the Gaussian kernel. Cholesky is still `O(n**3)` though, 
+and a full eigendecomposition is worse, so for big samples we only estimate the
+smallest eigenvalue with Lanczos from a random start vector. That only needs 
+matrix-vector products, and the Ritz values it produces always sit inside the
+spectrum, so if the estimate is clearly negative the kernel is definitely 
+invalid (and we can stop right there). That "inside the spectrum" needs the 
+Lanczos vectors to stay orthogonal, which takes a second pass of 
+reorthogonalization, and stopping once the residual is round-off (a low-rank 
+kernel like the linear one runs out of new directions after `rank` steps). 
+
+Since it only needs `K @ v`, the kernel matrix doesn't even have to exist. 
+`K` gets built once when it fits in `max_kernel_bytes`, and past that each 
+product builds it a block of rows at a time and throws the block away, which 
+trades recomputing the kernel every step for memory that's `block*n` instead 
+of `n**2` per worker. Each trial is independent so they run in parallel. 
+"""
+
+#%% [python]
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+def lanczos_min_eig(K, steps=100, rng=None, stop_below=None):
+    # K is a symmetric matrix, or a (matvec, n) pair so the matrix never has to exist
+    matvec, n = (K.__matmul__, K.shape[0]) if isinstance(K, np.ndarray) else K
+    rng = np.random.default_rng(rng)
+    steps = min(steps, n)
+    Q = np.zeros((steps, n))
+    alpha, beta = np.zeros(steps), np.zeros(steps)
+    q = rng.normal(size=n)
+    Q[0] = q / np.linalg.norm(q)
+    for j in range(steps):
+        w = matvec(Q[j])
+        alpha[j] = w @ Q[j]
+        # full reorthogonalization, twice, since one classical Gram-Schmidt pass isn't enough
+        # to keep Q orthogonal once w is mostly round-off; still cheap next to the matvec
+        for _ in range(2):
+            w -= Q[:j + 1].T @ (Q[:j + 1] @ w)
+        beta[j] = np.linalg.norm(w)
+        # the Krylov space ran out (rank-deficient K), measured against the size of K seen so far
+        if j + 1 == steps or beta[j] < 1e-10 * max(np.abs(alpha[:j + 1]).max(), beta[:j].max(initial=0)):
+            break
+        # Ritz values only move down as steps are added, so one below stop_below settles it
+        if stop_below is not None and j % 10 == 9 and _ritz_min(alpha, beta, j) < stop_below:
+            break
+        Q[j + 1] = w / beta[j]
+    return _ritz_min(alpha, beta, j)
+
+
+def _ritz_min(alpha, beta, j):
+    T = np.diag(alpha[:j + 1]) + np.diag(beta[:j], 1) + np.diag(beta[:j], -1)
+    return np.linalg.eigvalsh(T)[0]
+
+
+def kernel_matvec(kernel, X, block=1024):
+    # v -> K(X, X) @ v, one block of rows at a time, so memory is block*n instead of n*n
+    def matvec(v):
+        return np.concatenate([kernel(X[i:i + block], X) @ v for i in range(0, len(X), block)])
+    return matvec, len(X)
+
+
+def _mercer_trial(kernel, sampler, n, tol, cholesky_max, block, max_kernel_bytes, seed):
+    rng = np.random.default_rng(seed)
+    X = sampler(n, rng)
+    if n <= cholesky_max:
+        # kernels are symmetric by construction, and cholesky only reads the lower triangle anyway
+        K = kernel(X, X)
+        scale = max(np.abs(np.diag(K)).max(), 1e-300)
+        jitter = tol * scale
+        K[np.diag_indices(n)] += jitter
+        try:
+            np.linalg.cholesky(K)
+            return {"n": n, "psd": True, "min_eig": None, "method": "cholesky"}
+        except np.linalg.LinAlgError:
+            min_eig = np.linalg.eigvalsh(K)[0] - jitter
+            method = "cholesky"
+    else:
+        # form K once if it fits the budget, otherwise recompute it a block at a time every step
+        dense = block is None or n * n * 8 <= max_kernel_bytes
+        K = kernel(X, X) if dense else kernel_matvec(kernel, X, block)
+        step = n if dense else block
+        scale = max(max(np.abs(np.diag(kernel(X[i:i + step], X[i:i + step]))).max()
+                        for i in range(0, n, step)), 1e-300)
+        min_eig = lanczos_min_eig(K, rng=rng, stop_below=-tol * scale * n)
+        method = "lanczos"
+    return {"n": n, "psd": bool(min_eig >= -tol * scale * n), "min_eig": min_eig, "method": method}
+
+
+def mercer_check(kernel, sampler, n=500, trials=8, tol=1e-10, cholesky_max=3000, block=1024,
+                 max_kernel_bytes=2**30, n_jobs=None, seed=0):
+    # max_kernel_bytes is per worker
+    seeds = np.random.SeedSequence(seed).spawn(trials)
+    run = functools.partial(_mercer_trial, kernel, sampler, n, tol, cholesky_max, block, max_kernel_bytes)
+    with ProcessPoolExecutor(n_jobs) as pool:
+        results = list(pool.map(run, seeds))
+    return {"valid": all(r["psd"] for r in results), "trials": results}
+
+#%% [python]
+def normal_points(n, rng, d=3):
+    return rng.normal(size=(n, d))
+
+def neg_distance_kernel(X, Z):
+    # a "similarity" that looks reasonable but isn't a valid kernel
+    return -np.sqrt(np.maximum((X**2).sum(1)[:, None] + (Z**2).sum(1)[None, :] - 2 * X @ Z.T, 0))
+
+print(mercer_check(functools.partial(gaussian_kernel, sigma=2.0), normal_points, trials=4)["valid"])
+print(mercer_check(neg_distance_kernel, normal_points, n=5000, trials=2)["trials"])
+# low rank, so Lanczos runs out of directions early; this has to still come out valid
+print(mercer_check(linear_kernel, normal_points, n=4000, trials=2)["trials"])
+
+#%% [markdown]
+"""
+### Predicting with Only the Support Vectors
+
+Going back to the prediction function `h(x) = g(Sigma[i]*alpha[i]*y[i]*K(x[i],x) + b)`,
+the sum runs over the whole training set, but `alpha[i]` is zero for every
+point that isn't sitting on (or inside) the margin. Those are the support 
+vectors, and they're usually a small fraction of the data. So once training is
+done, we can throw everything else away and keep just 
+
+- `alpha[i]*y[i]` for the support vectors, 
+- the support vectors themselves, packed into one contiguous float32 block, and 
+- `b`. 
+
+And for the linear kernel we don't even need that, because `Sigma[i]*alpha[i]*y[i]*x[i]`
+is just `w`, so we collapse it once and prediction is a single dot product. 
+Scoring a batch is then one kernel block `K(X, SV)` and one matrix-vector 
+product, so the cost goes with the number of support vectors and not the size
+of the training set. 
+"""
+
+#%% [python]
+class SupportVectorPredictor:
+    def __init__(self, coef, support, b, kernel, kernel_args, w=None, n_support=None):
+        self.coef = coef
+        self.support = support
+        self.b = b
+        self.kernel = kernel
+        self.kernel_args = kernel_args
+        self.w = w
+        self.n_support = len(support) if n_support is None else n_support
+
+    @classmethod
+    def from_dual(cls, alpha, y, X, b, kernel=linear_kernel, tol=1e-8, **kernel_args):
+        sv = alpha > tol * max(alpha.max(), 1.0)
+        coef = (alpha[sv] * y[sv]).astype(np.float32)
+        support = np.ascontiguousarray(X[sv], dtype=np.float32)
+        if kernel is linear_kernel:
+            return cls(None, None, b, kernel, kernel_args, w=coef @ support, n_support=len(support))
+        return cls(coef, support, b, kernel, kernel_args)
+
+    def decision_function(self, X, batch=4096):
+        X = np.asarray(X, dtype=np.float32)
+        if self.w is not None:
+            return X @ self.w + self.b
+        out = np.empty(len(X), dtype=np.float32)
+        for i in range(0, len(X), batch):
+            out[i:i + batch] = self.kernel(X[i:i + batch], self.support, **self.kernel_args) @ self.coef
+        return out + self.b
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) >= 0, 1, -1)
+
+#%% [markdown]
+"""
+### Linear Kernel, Lots of Features
+
+When the kernel is just `K(x,z) = x**T*z`, we don't need any of the kernel
+machinery at all, and it's actually a bad idea to use it, because a Gram matrix
+over a million documents is never going to fit. Text is the typical case here: 
+tons of rows, tons of columns, but each row is mostly zeros. 
+
+The soft-margin dual from above, with the linear kernel and `b` folded into `w`
+as a constant feature (liblinear does this, it regularizes `b` a little but 
+nobody seems to mind), has only the box constraint `0 <= alpha[i] <= C`. So we
+can just do coordinate descent one `alpha[i]` at a time. With `w` kept 
+explicitly, the gradient for coordinate `i` is `y[i]*w**T*x[i] - 1`, which only
+touches the nonzeros of row `i`, and the update to `w` only touches them too. 
+
+The other trick is "shrinking". Points that sit at `alpha[i] = 0` way outside
+the margin, or at `alpha[i] = C` way inside it, are very unlikely to move again,
+so we stop visiting them. Once the rest converges we check everyone once more 
+to make sure we didn't drop something too early. 
+"""
+
+#%% [python]
+import scipy.sparse as sp
+
+class LinearSVM:
+    def __init__(self, C=1.0, tol=0.1, max_iter=1000, fit_intercept=True, rng=None):
+        self.C = C
+        self.tol = tol
+        self.max_iter = max_iter
+        self.fit_intercept = fit_intercept
+        self.rng = rng
+
+    def _augment(self, X):
+        X = sp.csr_matrix(X, dtype=np.float64)
+        if self.fit_intercept:
+            X = sp.hstack([X, np.ones((X.shape[0], 1))], format="csr")
+        return X
+
+    def fit(self, X, y):
+        X = self._augment(X)
+        data, indices, indptr = X.data, X.indices, X.indptr
+        n, C = X.shape[0], self.C
+        rng = np.random.default_rng(self.rng)
+        alpha = np.zeros(n)
+        w = np.zeros(X.shape[1])
+        Q = np.asarray(X.multiply(X).sum(1)).ravel()
+        active = np.flatnonzero(Q > 0)
+        M_bar, m_bar = np.inf, -np.inf
+        for it in range(self.max_iter):
+            M, m = -np.inf, np.inf
+            keep = np.ones(len(active), dtype=bool)
+            rng.shuffle(active)
+            for k, i in enumerate(active):
+                s, e = indptr[i], indptr[i + 1]
+                idx, val = indices[s:e], data[s:e]
+                G = y[i] * (w[idx] @ val) - 1
+                PG = 0.0
+                if alpha[i] == 0:
+                    if G > M_bar:
+                        keep[k] = False
+                        continue
+                    PG = min(G, 0.0)
+                elif alpha[i] == C:
+                    if G < m_bar:
+                        keep[k] = False
+                        continue
+                    PG = max(G, 0.0)
+                else:
+                    PG = G
+                M, m = max(M, PG), min(m, PG)
+                if PG != 0.0:
+                    old = alpha[i]
+                    alpha[i] = min(max(old - G / Q[i], 0.0), C)
+                    w[idx] += (alpha[i] - old) * y[i] * val
+            active = active[keep]
+            if M - m < self.tol:
+                if len(active) == np.count_nonzero(Q):
+                    break
+                # converged on the shrunk problem, so check everyone once more
+                active = np.flatnonzero(Q > 0)
+                M_bar, m_bar = np.inf, -np.inf
+                continue
+            M_bar = M if M > 0 else np.inf
+            m_bar = m if m < 0 else -np.inf
+        self.n_iter = it + 1
+        self.alpha = alpha
+        self.w = w[:-1] if self.fit_intercept else w
+        self.b = w[-1] if self.fit_intercept else 0.0
+        return self
+
+    def decision_function(self, X):
+        return np.asarray(X @ self.w).ravel() + self.b
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) >= 0, 1, -1)
+
+#%% [python]
+rng = np.random.default_rng(0)
+X = sp.random(5000, 2000, density=0.01, format="csr", random_state=0)
+w_true = rng.normal(size=2000)
+y = np.where(X @ w_true > 0, 1, -1)
+svm = LinearSVM(C=1.0).fit(X, y)
+print(svm.n_iter, (svm.predict(X) == y).mean())
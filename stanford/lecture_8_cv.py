@@ -167,4 +167,498 @@ describes a new model" and approach feature selection in fundamentally the same
 way. Step-wise regression, a non-regularized approach, functionally looks to 
 greedily optimize the `S[dev]` performance for each added variable trained on 
 `S[train]`. 
-"""
\ No newline at end of file
+"""
+#%% [markdown]
+"""
+### K-Fold in Code
+
+The pseudo-code above is a little loose (it trains on `S[i]` and tests on 
+`S[-i]`, which is backwards from how anyone actually does it, you train on
+everything _but_ fold `i`). Writing it properly, a couple of things stand out. 
+
+First, the folds don't need to be copies of the data. A fold is just a list of
+row indices. Second, the `k` fits are completely independent of each other, so
+there's no reason to run them one after another. The only thing that gets in
+the way is handing the data to each worker process, since pickling a big `X`
+over to every worker costs about as much as the fit. So we put `X` and `y` into
+shared memory once, and the workers just attach to it and get the index 
+arrays. 
+
+Two variants worth having: 
+
+- Repeated CV, which is just redoing the whole k-fold with a different shuffle
+  and averaging. Smooths out the luck of the split. 
+- Stratified CV, where each fold gets the same class proportions as the whole
+  set. Matters a lot when one class is rare. 
+"""
+
+#%% [python]
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+def kfold_indices(n, k=10, repeats=1, stratify=None, rng=None):
+    rng = np.random.default_rng(rng)
+    folds = []
+    for _ in range(repeats):
+        fold_of = np.empty(n, dtype=np.int64)
+        if stratify is None:
+            fold_of[rng.permutation(n)] = np.arange(n) % k
+        else:
+            # deal each class out round-robin so every fold gets its share
+            offset = 0
+            for c in np.unique(stratify):
+                members = rng.permutation(np.flatnonzero(stratify == c))
+                fold_of[members] = (offset + np.arange(len(members))) % k
+                offset += len(members)
+        for i in range(k):
+            test = np.flatnonzero(fold_of == i)
+            train = np.flatnonzero(fold_of != i)
+            folds.append((train, test))
+    return folds
+
+
+@contextlib.contextmanager
+def shared_arrays(**arrays):
+    blocks, specs = [], {}
+    try:
+        for name, a in arrays.items():
+            a = np.ascontiguousarray(a)
+            shm = SharedMemory(create=True, size=max(a.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(a.shape, a.dtype, buffer=shm.buf)[...] = a
+            specs[name] = (shm.name, a.shape, a.dtype.str)
+        yield specs
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+_shared = {}
+
+def _attach_shared(specs):
+    for name, (shm_name, shape, dtype) in specs.items():
+        shm = SharedMemory(name=shm_name)
+        _shared[name] = (shm, np.ndarray(shape, dtype, buffer=shm.buf))
+
+
+def _run_fold(fit, score, train, test):
+    X, y = _shared["X"][1], _shared["y"][1]
+    model = fit(X[train], y[train])
+    return score(model, X[test], y[test])
+
+
+def cross_validate(fit, score, X, y, k=10, repeats=1, stratified=False, n_jobs=None, rng=None):
+    folds = kfold_indices(len(X), k, repeats, y if stratified else None, rng)
+    with shared_arrays(X=X, y=y) as specs:
+        with ProcessPoolExecutor(n_jobs, initializer=_attach_shared, initargs=(specs,)) as pool:
+            futures = [pool.submit(_run_fold, fit, score, train, test) for train, test in folds]
+            scores = np.array([f.result() for f in futures])
+    return {"scores": scores, "mean": scores.mean(), "std": scores.std()}
+
+#%% [python]
+def fit_ridge(X, y, Lambda=1.0):
+    return np.linalg.solve(X.T @ X + Lambda * np.eye(X.shape[1]), X.T @ y)
+
+def mse(theta, X, y):
+    return ((X @ theta - y)**2).mean()
+
+rng = np.random.default_rng(0)
+X = rng.normal(size=(10_000, 20))
+y = X @ rng.normal(size=20) + rng.normal(size=10_000)
+print(cross_validate(fit_ridge, mse, X, y, k=10, repeats=2)["mean"])
+
+#%% [markdown]
+"""
+### Tuning Lambda Without Refitting
+
+Going back to the regularized linear regression objective, in practice you pick
+`Lambda` by trying a whole grid of them. Refitting from scratch for each one
+is a waste though, because of the normal equation, now with the penalty
+
+```
+theta = (X**T*X + Lambda*I)**-1 * X**T*y
+```
+
+If we take one thin SVD `X = U*S*V**T`, this becomes 
+`theta = V * diag(s/(s**2 + Lambda)) * U**T*y`. The `U**T*y` and `V` don't 
+depend on `Lambda` at all, so after the one SVD, each new `Lambda` is just 
+rescaling a length-`p` vector and one `p x p` product. The training error falls
+out the same way. 
+
+And we get two nice estimates of out-of-sample error for free. The "hat"
+matrix `H = X*(X**T*X + Lambda*I)**-1*X**T` maps `y` to the fitted values, and
+its diagonal is `h[i] = Sigma[k]*U[i,k]**2 * s[k]**2/(s[k]**2 + Lambda)`. Then
+
+- Leave-one-out CV error has a closed form, `(1/n)*Sigma[i]*((y[i] - yhat[i])/(1 - h[i]))**2`. 
+  No refits, which is kindof amazing. 
+- Generalized CV (GCV) swaps every `h[i]` for the average `tr(H)/n`, which
+  only costs `O(p)`. 
+"""
+
+#%% [python]
+def ridge_path(X, y, lambdas, fit_intercept=True, loo=True):
+    lambdas = np.asarray(lambdas, dtype=float)
+    n = len(X)
+    if fit_intercept:
+        x_mean, y_mean = X.mean(0), y.mean()
+        X, y = X - x_mean, y - y_mean
+    U, s, Vt = np.linalg.svd(X, full_matrices=False)
+    uy = U.T @ y
+    s2 = s**2
+    shrink = s2 / (s2[None, :] + lambdas[:, None])       # L x p, the diagonal of H in the U basis
+    coefs = (shrink / np.where(s > 0, s, 1) * uy) @ Vt
+    # residual = part of y outside span(U) plus the shrunk-away part inside it
+    rss = (y @ y - uy @ uy) + (((1 - shrink) * uy)**2).sum(1)
+    df = shrink.sum(1) + fit_intercept
+    out = {
+        "lambdas": lambdas,
+        "coefs": coefs,
+        "intercepts": y_mean - coefs @ x_mean if fit_intercept else np.zeros(len(lambdas)),
+        "train_mse": rss / n,
+        "df": df,
+        "gcv": (rss / n) / (1 - df / n)**2,
+    }
+    if loo:
+        resid = y[:, None] - U @ (shrink * uy).T        # n x L
+        h = (U**2) @ shrink.T + fit_intercept / n
+        out["loo_mse"] = ((resid / (1 - h))**2).mean(0)
+    return out
+
+#%% [python]
+path = ridge_path(X, y, np.logspace(-3, 4, 100))
+best = path["loo_mse"].argmin()
+print(path["lambdas"][best], path["loo_mse"][best], path["gcv"][best])
+
+#%% [markdown]
+"""
+### The Spam Filter Version
+
+For the spam filter case, the thing that does well is logistic regression with
+an L1 penalty (the LaSSO flavor, or elastic net if you mix in a little of the
+L2 penalty too). Minimizing 
+
+```
+-(1/n)*loglik(b, theta) + Lambda*(a*abs(theta) + (1-a)/2*abs(abs(theta))**2)
+```
+
+Same deal as ridge, we want the whole path over `Lambda`, not one fit. There's
+no SVD shortcut this time, but the glmnet folks (Friedman, Hastie, Tibshirani)
+have a few tricks that get you close: 
+
+1. Coordinate descent on a quadratic approximation of the log-likelihood (IRLS).
+   With an L1 penalty each coordinate update is just a soft-threshold. 
+2. Start at the `Lambda` where every `theta` is exactly 0, and walk down. Each
+   solution is a warm start for the next one, and they're very close. 
+3. "Strong rules". A feature whose gradient `abs(x[j]**T*(y - p))/n` is below
+   `a*(2*Lambda[k] - Lambda[k-1])` will almost surely stay at 0, so we never
+   touch it. Afterwards we check the KKT conditions on everything we skipped, 
+   and in the rare case one was wrong, we add it back and solve again. 
+
+With 100k sparse word features, nearly all of them spend nearly the whole path
+at zero, so this is where all the time savings come from. 
+"""
+
+#%% [python]
+import scipy.sparse as sp
+
+def _soft_threshold(z, t):
+    return np.sign(z) * max(abs(z) - t, 0.0)
+
+
+def _logistic_cd(X, y, beta, b0, cols, lam, a, tol, max_iter):
+    n = X.shape[0]
+    data, indices, indptr = X.data, X.indices, X.indptr
+    eta = X @ beta + b0
+    for _ in range(max_iter):
+        p = 1 / (1 + np.exp(-eta))
+        w = np.maximum(p * (1 - p), 1e-5)
+        r = (y - p) / w                        # working residual z - eta
+        beta_old = beta.copy()
+        todo = cols
+        while True:
+            max_step = 0.0
+            step = (w @ r) / w.sum()
+            b0 += step
+            r -= step
+            for j in todo:
+                s, e = indptr[j], indptr[j + 1]
+                idx, v = indices[s:e], data[s:e]
+                wv = w[idx] * v
+                xwx = (wv @ v) / n
+                if xwx == 0:
+                    continue
+                old = beta[j]
+                new = _soft_threshold((wv @ r[idx]) / n + xwx * old, lam * a) / (xwx + lam * (1 - a))
+                if new != old:
+                    beta[j] = new
+                    r[idx] -= v * (new - old)
+                    max_step = max(max_step, xwx * (new - old)**2)
+            if max_step < tol:
+                if todo is cols:
+                    break
+                todo = cols                     # one full pass to confirm
+            else:
+                todo = cols[beta[cols] != 0]    # cycle on the nonzeros
+        eta = X @ beta + b0
+        if np.abs(beta - beta_old).max() < np.sqrt(tol):
+            break
+    return beta, b0, eta
+
+
+def logistic_path(X, y, n_lambdas=100, lambda_min_ratio=1e-3, l1_ratio=1.0, tol=1e-7, max_iter=50):
+    X = sp.csc_matrix(X, dtype=np.float64)
+    n, p = X.shape
+    a = l1_ratio
+    ybar = y.mean()
+    b0 = np.log(ybar / (1 - ybar))
+    beta = np.zeros(p)
+    grad = np.abs(X.T @ (y - ybar)) / n
+    lam_max = grad.max() / max(a, 1e-3)
+    lambdas = lam_max * np.logspace(0, np.log10(lambda_min_ratio), n_lambdas)
+    coefs, intercepts, n_strong = [], [], []
+    lam_prev = lam_max
+    for lam in lambdas:
+        strong = (grad >= a * (2 * lam - lam_prev)) | (beta != 0)
+        while True:
+            beta, b0, eta = _logistic_cd(X, y, beta, b0, np.flatnonzero(strong), lam, a, tol, max_iter)
+            grad = np.abs(X.T @ (y - 1 / (1 + np.exp(-eta)))) / n
+            violations = ~strong & (grad > a * lam * (1 + 1e-6))
+            if not violations.any():
+                break
+            strong |= violations
+        coefs.append(sp.csr_matrix(beta))
+        intercepts.append(b0)
+        n_strong.append(strong.sum())
+        lam_prev = lam
+    return {
+        "lambdas": lambdas,
+        "coefs": sp.vstack(coefs, format="csr"),
+        "intercepts": np.array(intercepts),
+        "n_strong": np.array(n_strong),
+    }
+
+#%% [python]
+rng = np.random.default_rng(0)
+X_words = sp.random(2000, 5000, density=0.005, format="csr", random_state=0, data_rvs=np.ones)
+theta_true = np.zeros(5000)
+theta_true[:20] = 3 * rng.normal(size=20)
+y_spam = (rng.random(2000) < 1 / (1 + np.exp(-(X_words @ theta_true)))).astype(float)
+path = logistic_path(X_words, y_spam, n_lambdas=30, lambda_min_ratio=0.05)
+print(path["coefs"].getnnz(axis=1)[::5], path["n_strong"][::5])
+
+#%% [markdown]
+"""
+### Stepwise Regression, Cheaply
+
+Forward stepwise, written out naively: at every step, for every feature not
+yet in the model, refit the regression with that feature added and see which 
+one helps most. That's `p` full least-squares fits per step. 
+
+But we don't actually need to refit anything. If `Q` is an orthonormal basis
+for the columns we've already picked (a QR factorization), then adding column
+`x[j]` can only help through the part of `x[j]` that `Q` doesn't already 
+explain, `xr[j] = x[j] - Q*Q**T*x[j]`. The drop in squared error from adding it
+is exactly
+
+```
+(xr[j]**T * r)**2 / abs(abs(xr[j]))**2
+```
+
+where `r` is the current residual. So if we keep every candidate column already
+projected off of `Q`, scoring all of them is one matrix-vector product, and
+adding the winner to `Q` is one more rank-one update. That's `O(n*p)` per step.
+The `R` from the QR gives the actual coefficients by back-substitution whenever
+we want to check the model on `S[dev]`. 
+"""
+
+#%% [python]
+from scipy.linalg import solve_triangular
+
+def forward_stepwise(X, y, X_dev=None, y_dev=None, max_features=None, tol=1e-10):
+    n, p = X.shape
+    max_features = min(max_features or p, p, n - 1)
+    x_mean, y_mean = X.mean(0), y.mean()
+    Xr = X - x_mean                 # every candidate, projected off the selected ones
+    r = y - y_mean
+    norms = (Xr**2).sum(0)
+    floor = tol * np.maximum(norms, 1e-300)
+    available = norms > floor
+    selected, R_rows, qty = [], [], []
+    train_rss, dev_mse, coefs = [], [], []
+    for _ in range(max_features):
+        score = np.where(available, (Xr.T @ r)**2 / np.where(available, norms, 1), -np.inf)
+        j = score.argmax()
+        if not np.isfinite(score[j]):
+            break
+        q = Xr[:, j] / np.sqrt(norms[j])
+        c = q @ Xr                  # this becomes the next row of R
+        Xr -= np.outer(q, c)
+        norms = np.maximum(norms - c**2, 0)
+        qy = q @ r
+        r -= qy * q
+        selected.append(j)
+        R_rows.append(c)
+        qty.append(qy)
+        available[j] = False
+        available &= norms > floor  # drop columns that are now collinear
+        beta = solve_triangular(np.array(R_rows)[:, selected], np.array(qty))
+        coefs.append(beta)
+        train_rss.append(r @ r)
+        if X_dev is not None:
+            pred = y_mean + (X_dev[:, selected] - x_mean[selected]) @ beta
+            dev_mse.append(((y_dev - pred)**2).mean())
+    out = {"selected": np.array(selected), "coefs": coefs, "train_rss": np.array(train_rss)}
+    if X_dev is not None:
+        out["dev_mse"] = np.array(dev_mse)
+        out["best_k"] = int(np.argmin(dev_mse)) + 1
+    return out
+
+#%% [python]
+X = rng.normal(size=(3000, 300))
+y = X[:, :10] @ rng.normal(size=10) + rng.normal(size=3000)
+steps = forward_stepwise(X[:2000], y[:2000], X[2000:], y[2000:], max_features=30)
+print(steps["best_k"], sorted(steps["selected"][:steps["best_k"]]))
+
+#%% [markdown]
+"""
+### Splitting Without Shuffling
+
+One more practical thing about the 60/20/20 split on a 10 million row table. The
+textbook way is shuffle then slice, which means the whole table has to be in 
+memory, and the split changes every time somebody forgets to set a seed. 
+
+What I've seen done instead is to hash each row's key (user id, document id,
+whatever) and use the hash to pick the split. A good hash of the key is
+basically a uniform random number in `[0, 1)`, so 60% of keys land below 0.6, 
+and so on. But it's the _same_ number every time, on every machine, and we can
+decide each row the moment we read it. So we stream the file once and write
+each row straight to its split. A nice side effect is that rows added later
+don't shuffle old rows into a different split. 
+
+Python's built-in `hash` is salted per process, so that won't work. Use a real
+hash function. 
+"""
+
+#%% [python]
+import csv
+import hashlib
+import os
+
+def hash_unit(key, salt=""):
+    digest = hashlib.blake2b(f"{salt}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2**64
+
+
+def assign_split(key, fractions=(("train", 0.6), ("dev", 0.2), ("test", 0.2)), salt=""):
+    u = hash_unit(key, salt)
+    total = 0.0
+    for name, frac in fractions:
+        total += frac
+        if u < total:
+            return name
+    return fractions[-1][0]
+
+
+def split_csv(path, out_dir, key_column, fractions=(("train", 0.6), ("dev", 0.2), ("test", 0.2)), salt=""):
+    os.makedirs(out_dir, exist_ok=True)
+    counts = {name: 0 for name, _ in fractions}
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        key = header.index(key_column)
+        files = {name: open(os.path.join(out_dir, f"{name}.csv"), "w", newline="") for name in counts}
+        try:
+            writers = {name: csv.writer(out) for name, out in files.items()}
+            for w in writers.values():
+                w.writerow(header)
+            for row in reader:
+                name = assign_split(row[key], fractions, salt)
+                writers[name].writerow(row)
+                counts[name] += 1
+        finally:
+            for out in files.values():
+                out.close()
+    return counts
+
+#%% [python]
+from collections import Counter
+print(Counter(assign_split(i) for i in range(100_000)))
+
+#%% [markdown]
+"""
+### Model Selection on a Budget
+
+The model selection procedure from above trains every candidate all the way on
+`S[train]` before looking at `S[dev]`. With a grid over `Lambda` and polynomial
+order, most of those candidates are obviously bad long before they finish. 
+
+Successive halving (and Hyperband, which wraps it) bets on that. Give every 
+candidate a small budget (a few rows, or a few iterations), measure dev error,
+keep the best `1/eta` of them, multiply the budget by `eta`, and repeat. Only
+the few survivors ever get trained on the full budget. The risk is a candidate 
+that looks bad early and would have won at full budget, which is why Hyperband
+runs several brackets, trading how many candidates we start with against how
+small the starting budget is. Within a round every trial is independent, so 
+they run in parallel. 
+
+`train_eval(params, budget)` should train on `budget` units and return the 
+`S[dev]` error. 
+"""
+
+#%% [python]
+import math
+
+def successive_halving(train_eval, candidates, min_budget, max_budget, eta=3, pool=None):
+    survivors = list(candidates)
+    budget = min_budget
+    history = []
+    while True:
+        budget = min(budget, max_budget)
+        if pool is None:
+            errors = [train_eval(c, budget) for c in survivors]
+        else:
+            errors = list(pool.map(train_eval, survivors, [budget] * len(survivors)))
+        history.extend((c, budget, e) for c, e in zip(survivors, errors))
+        order = np.argsort(errors)
+        if budget >= max_budget or len(survivors) == 1:
+            return survivors[order[0]], errors[order[0]], history
+        keep = max(1, len(survivors) // eta)
+        survivors = [survivors[i] for i in order[:keep]]
+        budget *= eta
+
+
+def hyperband(train_eval, sample, min_budget, max_budget, eta=3, n_jobs=None, rng=None):
+    rng = np.random.default_rng(rng)
+    s_max = int(math.log(max_budget / min_budget, eta) + 1e-9)
+    best, best_error, history = None, np.inf, []
+    with ProcessPoolExecutor(n_jobs) as pool:
+        for s in range(s_max, -1, -1):
+            n = math.ceil((s_max + 1) / (s + 1) * eta**s)
+            candidates = [sample(rng) for _ in range(n)]
+            c, e, h = successive_halving(train_eval, candidates, max_budget / eta**s, max_budget, eta, pool)
+            history.extend(h)
+            if e < best_error:
+                best, best_error = c, e
+    return {"best": best, "error": best_error, "history": history}
+
+#%% [python]
+rng = np.random.default_rng(0)
+x_all = rng.uniform(-3, 3, size=30_000)
+y_all = np.sin(x_all) + 0.3 * rng.normal(size=30_000)
+x_train, y_train, x_dev, y_dev = x_all[:20_000], y_all[:20_000], x_all[20_000:], y_all[20_000:]
+
+def poly_ridge_dev_error(params, budget):
+    order, Lambda = params
+    n = int(budget)
+    P = np.vander(x_train[:n], order + 1)
+    theta = np.linalg.solve(P.T @ P + Lambda * np.eye(order + 1), P.T @ y_train[:n])
+    return ((np.vander(x_dev, order + 1) @ theta - y_dev)**2).mean()
+
+def sample_poly_ridge(rng):
+    return int(rng.integers(1, 12)), float(10**rng.uniform(-4, 3))
+
+search = hyperband(poly_ridge_dev_error, sample_poly_ridge, min_budget=100, max_budget=20_000, eta=3)
+print(search["best"], search["error"], len(search["history"]))
@@ -159,10 +159,298 @@ this is "something actionable". I don't see it.
 """
 
 
+#%% [markdown]
+"""
+### Just Simulating It
+
+Since the lecture didn't do it for me, here's how I'd convince myself. The
+Hoeffding bound is a statement about coin flips, so flip coins. For a given
+`phi`, `m` and `gamma`, draw `m` Bernoulli samples, compute `phi[est]`, check
+whether it missed by more than `gamma`, and repeat that a few hundred thousand
+times. The fraction of misses should sit below `2*e**(-2*gamma**2*m)`. 
+
+A couple of tricks to make this cheap. The sum of `m` Bernoulli draws is a 
+Binomial, so one binomial draw per trial is exactly the same as `m` coin flips.
+And we can split the trials across processes as long as each one gets its own
+independent random stream. Counter-based generators (Philox) are good for this,
+each stream is just a different key, so there's no chance of two workers
+overlapping. 
+
+Then the "actionable" part. If we're picking the best of `k` hypotheses, the 
+union bound says we need every one of their `k` error estimates to be within
+`gamma` at once, which gives
+
+```
+m >= log(2*k/delta) / (2*gamma**2)
+```
+
+samples to get that with probability at least `1 - delta`. That's actually a 
+useful formula for sizing an evaluation set. 
+"""
+
+#%% [python]
+import functools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+def _hoeffding_chunk(phi, ms, gammas, trials, seed):
+    rng = np.random.Generator(np.random.Philox(seed))
+    misses = np.zeros((len(ms), len(gammas)), dtype=np.int64)
+    for a, m in enumerate(ms):
+        deviation = np.abs(rng.binomial(m, phi, size=trials) / m - phi)
+        misses[a] = (deviation[:, None] > gammas[None, :]).sum(0)
+    return misses
+
+
+def hoeffding_simulation(phi, ms, gammas, trials=1_000_000, chunks=16, n_jobs=None, seed=0):
+    ms, gammas = np.asarray(ms), np.asarray(gammas, dtype=float)
+    sizes = np.diff(np.linspace(0, trials, chunks + 1).astype(int))
+    seeds = np.random.SeedSequence(seed).spawn(chunks)
+    run = functools.partial(_hoeffding_chunk, phi, ms, gammas)
+    with ProcessPoolExecutor(n_jobs) as pool:
+        misses = sum(pool.map(run, sizes, seeds))
+    return {
+        "empirical": misses / trials,
+        "bound": np.minimum(2 * np.exp(-2 * gammas[None, :]**2 * ms[:, None]), 1.0),
+    }
+
+
+def hoeffding_sample_size(gamma, delta=0.01, k=1):
+    return int(np.ceil(np.log(2 * k / delta) / (2 * gamma**2)))
+
+
+def hoeffding_gamma(m, delta=0.01, k=1):
+    return np.sqrt(np.log(2 * k / delta) / (2 * m))
+
+#%% [python]
+sim = hoeffding_simulation(0.3, ms=[10, 100, 1000], gammas=[0.01, 0.05, 0.1], trials=200_000)
+print(sim["empirical"])
+print(sim["bound"])
+print(hoeffding_sample_size(0.01, delta=0.01, k=100))
+
+#%% [markdown]
+"""
+### Looking at the Sampling Distribution
+
+Back to the idea at the top, that `h(theta)` is a random variable with a
+"Sampling Distribution". We only ever get one training set, so we can't see
+that distribution directly, but the bootstrap (lecture 10 goes into it more) 
+fakes it: treat the sample as the population, resample it with replacement, 
+refit, and look at the spread of the refitted parameters. The mean minus the 
+original fit estimates the bias, and the spread estimates the variance. 
+
+Copying the data `B` times for `B` resamples is the slow, memory-hungry way to 
+do it. A resample with replacement is really just a count of how many times 
+each row got picked, so we can pass those counts as weights to a fit that 
+accepts weights instead. And for large `n`, each row's count is very close to 
+`Poisson(1)` and independent of the others, so every worker can draw its own 
+weights locally without coordinating. Each worker gets the data once when it
+starts, and after that a resample is just a seed. 
+
+`fit(X, y, weights)` should return the parameter vector. 
+"""
+
+#%% [python]
+def bootstrap_indices(n, B, rng=None):
+    return np.random.default_rng(rng).integers(0, n, size=(B, n))
+
+
+def poisson_weights(n, B, rng=None):
+    return np.random.default_rng(rng).poisson(1.0, size=(B, n)).astype(np.float64)
+
+
+_boot_data = {}
+
+def _boot_init(fit, X, y):
+    _boot_data.update(fit=fit, X=X, y=y)
+
+
+def _boot_fit(seed):
+    X, y = _boot_data["X"], _boot_data["y"]
+    weights = poisson_weights(len(X), 1, np.random.Generator(np.random.Philox(seed)))[0]
+    return _boot_data["fit"](X, y, weights)
+
+
+def bootstrap(fit, X, y, B=1000, alpha=0.05, n_jobs=None, seed=0):
+    theta_hat = np.asarray(fit(X, y, np.ones(len(X))))
+    seeds = np.random.SeedSequence(seed).spawn(B)
+    with ProcessPoolExecutor(n_jobs, initializer=_boot_init, initargs=(fit, X, y)) as pool:
+        thetas = np.array(list(pool.map(_boot_fit, seeds, chunksize=max(1, B // 64))))
+    return {
+        "theta": theta_hat,
+        "resamples": thetas,
+        "bias": thetas.mean(0) - theta_hat,
+        "variance": thetas.var(0, ddof=1),
+        "ci": np.quantile(thetas, [alpha / 2, 1 - alpha / 2], axis=0),
+    }
+
+#%% [python]
+def weighted_least_squares(X, y, weights):
+    Xw = X * weights[:, None]
+    return np.linalg.solve(Xw.T @ X, Xw.T @ y)
+
+rng = np.random.default_rng(0)
+X = np.c_[np.ones(5000), rng.normal(size=(5000, 2))]
+y = X @ [1.0, 2.0, -0.5] + rng.normal(size=5000)
+boot = bootstrap(weighted_least_squares, X, y, B=500)
+print(boot["theta"], np.sqrt(boot["variance"]), np.sqrt(np.diag(np.linalg.inv(X.T @ X))))
+
 #%% [markdown]
 """
 ### VC Dimensions
 
 Supposedly, this is some kind of generalization of the above but to a space of
 infinite hypotheses. It's super rushed. 
-"""
\ No newline at end of file
+"""
+#%% [markdown]
+"""
+Since the lecture skipped it, the definition as I understand it. A hypothesis 
+class `H` "shatters" a set of `k` points if, for every one of the `2**k` ways 
+to label those points, some `h` in `H` gets all of them right. The VC
+dimension of `H` is the size of the biggest set of points it can shatter. 
+Linear separators in `R**d` have VC dimension `d + 1`, for example: any 3 
+points in general position in the plane can be shattered by a line, but no 4
+points can be. 
+
+The definition is pretty easy to turn into a brute-force check, which at least
+lets me poke at it. Write each labeling as the bits of a number from `0` to 
+`2**k - 1`, and then check each labeling for some simple classes: 
+
+- Thresholds on a line, `h(x) = 1[x >= t]`: in sorted order, the labels have
+  to be all 0s and then all 1s. 
+- Intervals, `h(x) = 1[a <= x <= b]`: in sorted order, the 1s have to be in
+  one contiguous run. 
+- Axis-aligned rectangles (1 inside): the smallest box around the positive
+  points can't contain any negative ones. 
+- Linear separators `sign(w**T*x + b)`: this one needs a real check. We run 
+  the perceptron on all the labelings at once for a bit, since anything it 
+  separates is separable. Whatever's left gets a linear program, which gives
+  an exact answer. 
+
+All of the first three are just vectorized array ops over the whole
+`2**k x k` matrix of labels. For linear separators, flipping every label gives
+the same answer (use `-w`), so we only need half the labelings. We stop as
+soon as one labeling fails, and the LP checks run in parallel. 
+"""
+
+#%% [python]
+from concurrent.futures import FIRST_COMPLETED, wait
+from scipy.optimize import linprog
+
+def all_labelings(k):
+    return ((np.arange(2**k)[:, None] >> np.arange(k)) & 1).astype(bool)
+
+
+def _sorted_labels(x, labels):
+    order = np.argsort(x, kind="stable")
+    x, labels = x[order], labels[:, order]
+    # tied points have to get the same label from a threshold or an interval
+    ties = x[1:] == x[:-1]
+    consistent = ~(labels[:, 1:] != labels[:, :-1])[:, ties].any(1)
+    return labels, consistent
+
+
+def _threshold_realizable(x, labels):
+    labels, consistent = _sorted_labels(x, labels)
+    return consistent & ~(labels[:, :-1] & ~labels[:, 1:]).any(1)
+
+
+def _interval_realizable(x, labels):
+    labels, consistent = _sorted_labels(x, labels)
+    starts = (labels[:, 1:] & ~labels[:, :-1]).sum(1) + labels[:, 0]
+    return consistent & (starts <= 1)
+
+
+def _rectangle_realizable(X, labels):
+    pos = labels[:, :, None]
+    lo = np.where(pos, X[None], np.inf).min(1)
+    hi = np.where(pos, X[None], -np.inf).max(1)
+    inside = ((X[None] >= lo[:, None]) & (X[None] <= hi[:, None])).all(2)
+    return ~(inside & ~labels).any(1)
+
+
+def _linear_separable_lp(Xa, labels):
+    results = []
+    for row in labels:
+        y = np.where(row, 1.0, -1.0)
+        lp = linprog(np.zeros(Xa.shape[1]), A_ub=-y[:, None] * Xa, b_ub=-np.ones(len(y)),
+                     bounds=[(None, None)] * Xa.shape[1], method="highs")
+        results.append(lp.status == 0)
+    return np.array(results)
+
+
+def _linear_realizable(X, labels, epochs=200, pool=None, chunk=64):
+    Xa = np.c_[X, np.ones(len(X))]
+    Y = np.where(labels, 1.0, -1.0)
+    W = np.zeros((len(labels), Xa.shape[1]))
+    done = np.zeros(len(labels), dtype=bool)
+    for _ in range(epochs):
+        wrong = (Y * (W @ Xa.T) <= 0) & ~done[:, None]
+        done |= ~wrong.any(1)
+        if done.all():
+            return done
+        W += (Y * wrong) @ Xa
+    todo = np.flatnonzero(~done)
+    out = done.copy()
+    if pool is None:
+        for i in range(0, len(todo), chunk):
+            ok = _linear_separable_lp(Xa, labels[todo[i:i + chunk]])
+            out[todo[i:i + chunk]] = ok
+            if not ok.all():
+                break
+        return out
+    pending = {pool.submit(_linear_separable_lp, Xa, labels[todo[i:i + chunk]]): todo[i:i + chunk]
+               for i in range(0, len(todo), chunk)}
+    while pending:
+        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for f in finished:
+            idx = pending.pop(f)
+            out[idx] = f.result()
+            if not out[idx].all():
+                for rest in pending:
+                    rest.cancel()
+                return out
+    return out
+
+
+def shatters(X, hypothesis_class, n_jobs=None, max_points=20):
+    X = np.asarray(X, dtype=float)
+    if X.ndim == 1:
+        X = X[:, None]
+    k = len(X)
+    if k > max_points:
+        raise ValueError(f"{k} points means 2**{k} labelings, raise max_points if you mean it")
+    labels = all_labelings(k)
+    if hypothesis_class == "threshold":
+        ok = _threshold_realizable(X[:, 0], labels)
+    elif hypothesis_class == "interval":
+        ok = _interval_realizable(X[:, 0], labels)
+    elif hypothesis_class == "rectangle":
+        ok = _rectangle_realizable(X, labels)
+    elif hypothesis_class == "linear":
+        # labeling and its complement are equivalent, so only check the ones with the last bit clear
+        half = labels[~labels[:, -1]]
+        with ProcessPoolExecutor(n_jobs) as pool:
+            ok = _linear_realizable(X, half, pool=pool)
+    else:
+        raise ValueError(f"unknown hypothesis class {hypothesis_class!r}")
+    return bool(ok.all())
+
+
+def vc_lower_bound(hypothesis_class, sampler, k_max=10, tries=20, n_jobs=None, rng=None):
+    # largest k for which we found some shattered set; a lower bound on the VC dimension
+    rng = np.random.default_rng(rng)
+    best = 0
+    for k in range(1, k_max + 1):
+        if not any(shatters(sampler(k, rng), hypothesis_class, n_jobs) for _ in range(tries)):
+            break
+        best = k
+    return best
+
+#%% [python]
+def plane_points(k, rng):
+    return rng.normal(size=(k, 2))
+
+for cls in ["threshold", "interval", "rectangle", "linear"]:
+    sampler = (lambda k, rng: rng.normal(size=k)) if cls in ("threshold", "interval") else plane_points
+    print(cls, vc_lower_bound(cls, sampler, k_max=6, tries=10))